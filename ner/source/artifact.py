@@ -0,0 +1,142 @@
+# !/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Python release: 3.9 or newer, the package uses multiprocessing.shared_memory
+#                 (3.8) and tracemalloc.reset_peak (3.9).
+
+"""
+Binary model file for the NER system.
+
+The layout of the file:
+
+    magic       8 bytes  b'NERMODEL'
+    version     uint32   little endian
+    header_len  uint32   little endian
+    header      header_len bytes of utf-8 json
+    arrays      each one aligned to ALIGN bytes
+
+The header keeps the meta information and, for each array,
+its dtype, shape and offset, so the arrays can be memory-mapped.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'NERMODEL'
+VERSION = 1
+ALIGN = 64
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write(path, meta, arrays):
+    """Write the meta information and the arrays into one file.
+
+    Args:
+        path: str - The path of the model file.
+        meta: dict - Json serializable meta information.
+        arrays: dict(str, numpy.ndarray)
+    """
+    arrays = {name: np.ascontiguousarray(arr)
+              for name, arr in arrays.items()}
+
+    # The offsets are relative to the end of the header.
+    table = dict()
+    offset = 0
+    for name, arr in arrays.items():
+        offset = _aligned(offset)
+        table[name] = {
+                'dtype': arr.dtype.str,
+                'shape': list(arr.shape),
+                'offset': offset,
+                }
+        offset += arr.nbytes
+    header = json.dumps({'meta': meta, 'arrays': table}).encode('utf-8')
+    start = _aligned(len(MAGIC) + 8 + len(header))
+    header += b' ' * (start - len(MAGIC) - 8 - len(header))
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<II', VERSION, len(header)))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(start + table[name]['offset'])
+            f.write(arr.tobytes())
+
+
+def read(path, mmap=True):
+    """Read the model file.
+
+    Args:
+        path: str - The path of the model file.
+        mmap: bool - Memory-map the arrays instead of reading them.
+
+    Returns:
+        meta: dict
+        arrays: dict(str, numpy.ndarray) - Read-only if memory-mapped.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise Exception('Not a NER model file: {a}'.format(a=path))
+        version, header_len = struct.unpack('<II', f.read(8))
+        if version != VERSION:
+            raise Exception('Unsupported model version {a} !'.format(
+                a=version))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+        start = len(MAGIC) + 8 + header_len
+        if not mmap:
+            f.seek(start)
+            body = f.read()
+
+    arrays = dict()
+    for name, info in header['arrays'].items():
+        dtype = np.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        if mmap and int(np.prod(shape)) > 0:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r',
+                                     offset=start + info['offset'],
+                                     shape=shape)
+        elif mmap:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            count = int(np.prod(shape))
+            arrays[name] = np.frombuffer(body, dtype=dtype, count=count,
+                                         offset=info['offset'])
+            arrays[name] = arrays[name].reshape(shape)
+    return header['meta'], arrays
+
+
+def pack_strings(strings):
+    """Pack a list of strings into an uint8 array.
+
+    The words and poss never contain white spaces,
+    so they are joined with new lines.
+
+    Args:
+        strings: list(str)
+
+    Returns:
+        numpy.ndarray
+    """
+    blob = '\n'.join(strings).encode('utf-8')
+    return np.frombuffer(blob, dtype=np.uint8)
+
+
+def unpack_strings(arr):
+    """Unpack the strings packed by pack_strings.
+
+    Args:
+        arr: numpy.ndarray
+
+    Returns:
+        list(str)
+    """
+    blob = arr.tobytes().decode('utf-8')
+    if len(blob) == 0:
+        return []
+    return blob.split('\n')
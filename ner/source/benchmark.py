@@ -0,0 +1,657 @@
+# !/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Python release: 3.9 or newer, the package uses multiprocessing.shared_memory
+#                 (3.8) and tracemalloc.reset_peak (3.9).
+
+"""
+Benchmark the stages of the NER pipeline.
+
+Example:
+
+    python3 benchmark.py --scales 1 2 10 50 --output bench.json
+    python3 benchmark.py --scales 1 --compare bench.json
+    python3 benchmark.py --scales 1 --trace-memory
+    python3 benchmark.py --scales 1 --stages server --server-clients 1 16 64
+    python3 benchmark.py --imports
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from utils import IOManager
+from sentence import NERDic
+from sentence import Sentence
+from viterbi import Viterbi
+from ner import NER
+from evaluate import Evaluator
+import sentence
+
+FTYPES = ['word', 'poscon', 'lexcon', 'bothcon']
+# The startup of each entry point, as the code run by a fresh interpreter.
+IMPORTS = {
+        'python': 'pass',
+        'evaluate': 'import evaluate',
+        'viterbi': 'import ner',
+        'train': 'import ner; from sklearn import svm',
+        }
+STAGES = ['read', 'nerdic', 'features', 'prepare_feats', 'learner_train',
+          'predict', 'tag', 'server', 'viterbi_train', 'viterbi_search',
+          'viterbi_beam']
+# The seconds to wait for the server to listen.
+SERVER_TIMEOUT = 60
+
+
+def peak_rss():
+    """Return the peak resident set size of the process in MB.
+
+    It only grows over the run, see Benchmark for the peak of a stage.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    if sys.platform == 'darwin':
+        return usage / (1 << 20)
+    return usage / (1 << 10)
+
+
+def scale_corpus(path, scale, tmp_dir):
+    """Write a copy of the corpus repeated scale times.
+
+    Args:
+        path: str - The corpus path.
+        scale: int - The number of copies.
+        tmp_dir: str - The directory of the scaled corpus.
+
+    Returns:
+        str - The path of the scaled corpus.
+    """
+    if scale == 1:
+        return path
+    name = '{a}.x{b}'.format(a=os.path.basename(path), b=scale)
+    scaled = os.path.join(tmp_dir, name)
+    with open(scaled, 'wb') as out:
+        for _ in range(scale):
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out)
+    return scaled
+
+
+def wait_server(proc, path):
+    """Wait until the server listens on its Unix socket.
+
+    Args:
+        proc: subprocess.Popen - The server process.
+        path: str - The path of the Unix socket.
+    """
+    deadline = time.time() + SERVER_TIMEOUT
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise Exception('The server exited with {a} !'.format(
+                a=proc.returncode))
+        if os.path.exists(path):
+            return
+        time.sleep(0.1)
+    raise Exception('The server is not listening !')
+
+
+async def load_server(path, items, clients):
+    """Send the sentences to a server from concurrent clients,
+    each client waits for the answer of a sentence before
+    sending the next one.
+
+    Args:
+        path: str - The path of the Unix socket.
+        items: list((words, poss))
+        clients: int - The number of concurrent connections.
+
+    Returns:
+        seconds: float - The wall time of all the sentences.
+        latency: list(float) - The latency of each sentence in seconds.
+    """
+    latency = []
+
+    async def client(k):
+        reader, writer = await asyncio.open_unix_connection(path)
+        try:
+            for words, poss in items[k::clients]:
+                request = {'words': words, 'poss': poss}
+                begin = time.perf_counter()
+                writer.write(json.dumps(request).encode('utf-8') + b'\n')
+                answer = json.loads(await reader.readline())
+                latency.append(time.perf_counter() - begin)
+                if 'error' in answer:
+                    raise Exception(answer['error'])
+        finally:
+            writer.close()
+
+    begin = time.perf_counter()
+    await asyncio.gather(*[client(k) for k in range(clients)])
+    return time.perf_counter() - begin, latency
+
+
+class Benchmark:
+    """Time each stage of the pipeline on one scale of the corpora.
+
+    The stages are timed without tracing. With trace_memory, the run
+    is a separate memory pass instead: the memory of a stage is the
+    peak traced by tracemalloc above the memory already allocated when
+    the stage started, and the times are slowed down by the tracing.
+    """
+    def __init__(self, train_path, test_paths, scale, args,
+                 trace_memory=False):
+        """Construct a new benchmark.
+
+        Args:
+            train_path: str - The path of the (scaled) training set.
+            test_paths: list(str) - The paths of the (scaled) test sets.
+            scale: int - The scale of the corpora.
+            args: argparse.Namespace - The command line options.
+            trace_memory: bool - Whether it is the memory pass.
+        """
+        self._io = IOManager()
+        self._train_path = train_path
+        self._test_paths = test_paths
+        self._scale = scale
+        self._args = args
+        self._trace_memory = trace_memory
+        self.results = []
+
+        # The intermediate objects shared by the stages.
+        self._nerdic = None
+        self._sentences = None
+        self._feats = None
+        self._labels = None
+        self._ner = None
+        self._viterbi = None
+        # The traced memory at the start of the current stage.
+        self._base_memory = 0
+
+    def run(self, stages):
+        """Run the given stages in the pipeline order.
+
+        Args:
+            stages: list(str)
+        """
+        tracing = self._trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        try:
+            for stage in STAGES:
+                if stage in stages:
+                    self._reset_memory()
+                    getattr(self, '_stage_' + stage)()
+        finally:
+            if tracing:
+                tracemalloc.stop()
+
+    def add_memory(self, traced):
+        """Copy the memory peaks of a memory pass into the results.
+
+        Args:
+            traced: Benchmark - The memory pass of the same stages.
+        """
+        for result, other in zip(self.results, traced.results):
+            if (result['stage'], result['corpus']) != (other['stage'],
+                                                       other['corpus']):
+                raise Exception('The memory pass is not matched !')
+            result['peak_traced_mb'] = other['peak_traced_mb']
+
+    ########################################################
+    # Stages
+    ########################################################
+    def _stage_read(self):
+        for path in [self._train_path] + self._test_paths:
+            begin = time.perf_counter()
+            items = [words for words, _, _ in self._io.read_sentences(path)]
+            seconds = time.perf_counter() - begin
+            self._record('read', path, items, seconds)
+
+    def _dictionary(self):
+        if self._nerdic is None:
+            self._nerdic = NERDic(self._train_path, self._args.hash_bits)
+        return self._nerdic
+
+    def _train_sentences(self):
+        if self._sentences is None:
+            nerdic = self._dictionary()
+            self._sentences = [
+                    Sentence(labels, words, poss, nerdic)
+                    for words, poss, labels
+                    in self._io.read_sentences(self._train_path)]
+        return self._sentences
+
+    def _stage_nerdic(self):
+        begin = time.perf_counter()
+        self._nerdic = NERDic(self._train_path, self._args.hash_bits)
+        seconds = time.perf_counter() - begin
+        items = [words for words, _, _
+                 in self._io.read_sentences(self._train_path)]
+        self._record('nerdic', self._train_path, items, seconds)
+
+    def _stage_features(self):
+        sentences = self._train_sentences()
+        for ftype in FTYPES:
+            latency = []
+            for sent in sentences:
+                begin = time.perf_counter()
+                sent.generate_features(ftype)
+                latency.append(time.perf_counter() - begin)
+            self._record('features:' + ftype, self._train_path, sentences,
+                         sum(latency), latency)
+
+    def _stage_prepare_feats(self):
+        sentences = self._train_sentences()
+        ner = self._new_ner()
+        begin = time.perf_counter()
+        self._feats, self._labels = ner._prepare_feats(sentences,
+                                                       self._args.ftype)
+        seconds = time.perf_counter() - begin
+        self._record('prepare_feats', self._train_path, sentences, seconds)
+
+    def _stage_learner_train(self):
+        if self._feats is None:
+            self._stage_prepare_feats()
+        labels = np.array(self._labels)
+        ner = self._new_ner()
+        begin = time.perf_counter()
+        for i, learner in enumerate(ner._learners):
+            learner.train(self._feats, (labels == i).astype(np.int64))
+        seconds = time.perf_counter() - begin
+        ner._ftype = self._args.ftype
+        self._ner = ner
+        self._record('learner_train', self._train_path,
+                     self._train_sentences(), seconds)
+
+    def _stage_predict(self):
+        if self._ner is None:
+            self._stage_learner_train()
+        ner = self._ner
+        ftype = self._args.ftype
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'output.txt')
+            for path in self._test_paths:
+                begin = time.perf_counter()
+                ner.predict(path, output_path, ftype)
+                seconds = time.perf_counter() - begin
+
+                # Single sentence latency on a sample.
+                sentences = self._test_sentences(path)
+                latency = []
+                for sent in sentences[:self._args.latency_sample]:
+                    begin = time.perf_counter()
+                    ner._predict_ids([sent], ftype)
+                    latency.append(time.perf_counter() - begin)
+                self._record('predict', path, sentences, seconds, latency)
+
+    def _stage_tag(self):
+        if self._ner is None:
+            self._stage_learner_train()
+        ner = self._ner
+        for path in self._test_paths:
+            items = [(words, poss) for words, poss, _
+                     in self._io.read_sentences(path)]
+            # Warm up the buffers.
+            for words, poss in items[:10]:
+                ner.tag(words, poss)
+            latency = []
+            for words, poss in items[:self._args.latency_sample]:
+                begin = time.perf_counter()
+                ner.tag(words, poss)
+                latency.append(time.perf_counter() - begin)
+            sample = [words for words, _ in items[:len(latency)]]
+            # The single sentence target is in microseconds.
+            micro = np.array(latency) * 1e6
+            extra = None
+            if len(micro) != 0:
+                extra = {
+                        'latency_p50_us': float(np.percentile(micro, 50)),
+                        'latency_p99_us': float(np.percentile(micro, 99)),
+                        }
+            self._record('tag', path, sample, sum(latency), latency, extra)
+
+            begin = time.perf_counter()
+            ner.tag_many(items)
+            seconds = time.perf_counter() - begin
+            self._record('tag_many', path, [words for words, _ in items],
+                         seconds)
+
+    def _stage_server(self):
+        if self._ner is None:
+            self._stage_learner_train()
+        cwd = os.path.dirname(os.path.abspath(__file__))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model_path = os.path.join(tmp_dir, 'model.bin')
+            self._ner.save(model_path)
+            sock = os.path.join(tmp_dir, 'ner.sock')
+            proc = subprocess.Popen(
+                    [sys.executable, 'server.py', model_path,
+                     '--socket', sock], cwd=cwd, stdout=subprocess.DEVNULL)
+            try:
+                wait_server(proc, sock)
+                for path in self._test_paths:
+                    items = [(words, poss) for words, poss, _
+                             in self._io.read_sentences(path)]
+                    for clients in self._args.server_clients:
+                        seconds, latency = asyncio.run(
+                                load_server(sock, items, clients))
+                        self._record('server:{a}'.format(a=clients), path,
+                                     [words for words, _ in items], seconds,
+                                     latency, {'clients': clients})
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    def _stage_viterbi_train(self):
+        sentences = self._train_sentences()
+        begin = time.perf_counter()
+        viterbi = Viterbi(len(sentence.REVERSE_LABELS))
+        viterbi.train(sentences)
+        viterbi.compile()
+        seconds = time.perf_counter() - begin
+        self._viterbi = viterbi
+        self._record('viterbi_train', self._train_path, sentences, seconds)
+
+    def _stage_viterbi_search(self):
+        if self._viterbi is None:
+            self._stage_viterbi_train()
+        viterbi = self._viterbi
+        for path in self._test_paths:
+            sentences = self._test_sentences(path)
+            latency = []
+            for sent in sentences:
+                begin = time.perf_counter()
+                viterbi.search(sent)
+                latency.append(time.perf_counter() - begin)
+            self._record('viterbi_search', path, sentences, sum(latency),
+                         latency)
+
+            begin = time.perf_counter()
+            viterbi.search_batch(sentences)
+            seconds = time.perf_counter() - begin
+            self._record('viterbi_search_batch', path, sentences, seconds)
+
+    def _stage_viterbi_beam(self):
+        if self._viterbi is None:
+            self._stage_viterbi_train()
+        viterbi = self._viterbi
+        for path in self._test_paths:
+            sentences = self._test_sentences(path)
+            exact = viterbi.search_batch(sentences)
+            for beam in self._args.beams:
+                latency = []
+                for sent in sentences[:self._args.latency_sample]:
+                    begin = time.perf_counter()
+                    viterbi.search(sent, beam)
+                    latency.append(time.perf_counter() - begin)
+
+                begin = time.perf_counter()
+                seqs = viterbi.search_batch(sentences, beam=beam)
+                seconds = time.perf_counter() - begin
+
+                # The accuracy against the gold labels and the exact search.
+                evaluator = Evaluator()
+                same = 0
+                for sent, seq, best in zip(sentences, seqs, exact):
+                    evaluator.add_tags(
+                            sent.tags,
+                            [sentence.REVERSE_LABELS[i] for i in seq])
+                    same += seq == best
+                extra = {
+                        'beam': beam,
+                        'fb1': evaluator.results()['overall']['fb1'],
+                        'exact_match': same / max(len(sentences), 1),
+                        }
+                self._record('viterbi_beam:{a}'.format(a=beam), path,
+                             sentences, seconds, latency, extra)
+
+    ########################################################
+    # Private methods
+    ########################################################
+    def _new_ner(self):
+        ner = NER(self._args.max_iter, hash_bits=self._args.hash_bits)
+        ner._nerdic = self._dictionary()
+        return ner
+
+    def _reset_memory(self):
+        """Start the memory peak of a new stage.
+        """
+        if not self._trace_memory:
+            return
+        tracemalloc.reset_peak()
+        self._base_memory = tracemalloc.get_traced_memory()[0]
+
+    def _test_sentences(self, path):
+        nerdic = self._nerdic
+        return [Sentence(labels, words, poss, nerdic)
+                for words, poss, labels in self._io.read_sentences(path)]
+
+    def _record(self, stage, path, sentences, seconds, latency=None,
+                extra=None):
+        """Record the result of one stage.
+
+        Args:
+            stage: str - The name of the stage.
+            path: str - The corpus of the stage.
+            sentences: list - The sentences (or the word lists)
+                              processed by the stage.
+            seconds: float - The wall time of the stage.
+            latency: list(float) - The per-sentence latency in seconds.
+            extra: dict - The stage specific results.
+        """
+        tokens = sum(len(sent) for sent in sentences)
+        result = {
+                'stage': stage,
+                'corpus': os.path.basename(path).split('.x')[0],
+                'scale': self._scale,
+                'sentences': len(sentences),
+                'tokens': tokens,
+                'seconds': seconds,
+                'tokens_per_sec': tokens / seconds if seconds > 0 else None,
+                'peak_rss_mb': peak_rss(),
+                'peak_traced_mb': None,
+                'latency_p50_ms': None,
+                'latency_p99_ms': None,
+                }
+        if latency:
+            latency = np.array(latency) * 1000
+            result['latency_p50_ms'] = float(np.percentile(latency, 50))
+            result['latency_p99_ms'] = float(np.percentile(latency, 99))
+        if extra is not None:
+            result.update(extra)
+        self.results.append(result)
+        if not self._trace_memory:
+            print(format_result(result))
+            return
+        result['peak_traced_mb'] = (tracemalloc.get_traced_memory()[1] -
+                                    self._base_memory) / (1 << 20)
+        print(format_memory(result))
+        # The next result of the same stage has its own peak.
+        self._reset_memory()
+
+
+def format_result(result):
+    s = '{a:<22} {b:<10} x{c:<3} {d:>10.3f}s {e:>12} tok/s {f:>8.1f}MB'
+    s = s.format(a=result['stage'], b=result['corpus'], c=result['scale'],
+                 d=result['seconds'],
+                 e='{:.0f}'.format(result['tokens_per_sec'] or 0),
+                 f=result['peak_rss_mb'])
+    if 'latency_p50_us' in result:
+        s += '  p50 {a:.1f}us p99 {b:.1f}us'.format(
+                a=result['latency_p50_us'], b=result['latency_p99_us'])
+    elif result['latency_p50_ms'] is not None:
+        s += '  p50 {a:.3f}ms p99 {b:.3f}ms'.format(
+                a=result['latency_p50_ms'], b=result['latency_p99_ms'])
+    if 'fb1' in result:
+        s += '  FB1 {a:.2f} exact {b:.1%}'.format(a=result['fb1'],
+                                                  b=result['exact_match'])
+    return s
+
+
+def format_memory(result):
+    s = '{a:<22} {b:<10} x{c:<3} {d:>10.1f}MB traced'
+    return s.format(a=result['stage'], b=result['corpus'], c=result['scale'],
+                    d=result['peak_traced_mb'])
+
+
+def import_times(repeat):
+    """Time the startup of the entry points in fresh interpreters.
+
+    Args:
+        repeat: int - The number of runs, the best one is kept.
+
+    Returns:
+        list(dict) - The results in the format of Benchmark.results.
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for name, code in IMPORTS.items():
+        seconds = []
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            subprocess.check_call([sys.executable, '-c', code], cwd=cwd)
+            seconds.append(time.perf_counter() - begin)
+        result = {
+                'stage': 'import:' + name,
+                'corpus': '-',
+                'scale': 1,
+                'sentences': 0,
+                'tokens': 0,
+                'seconds': min(seconds),
+                'tokens_per_sec': None,
+                'peak_rss_mb': peak_rss(),
+                'peak_traced_mb': None,
+                'latency_p50_ms': float(np.percentile(seconds, 50)) * 1000,
+                'latency_p99_ms': float(np.percentile(seconds, 99)) * 1000,
+                }
+        results.append(result)
+        print(format_result(result))
+    return results
+
+
+def meta_info():
+    """Collect the information of the environment.
+    """
+    try:
+        commit = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+            'commit': commit,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'argv': sys.argv[1:],
+            }
+
+
+def compare(results, baseline_path, threshold):
+    """Compare the results with a baseline run.
+
+    Args:
+        results: list(dict) - The results of this run.
+        baseline_path: str - The json file of the baseline run.
+        threshold: float - The slowdown ratio treated as a regression.
+
+    Returns:
+        list(str) - The regressed stages.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    old = {(r['stage'], r['corpus'], r['scale']): r for r in baseline}
+    regressions = []
+    for result in results:
+        key = (result['stage'], result['corpus'], result['scale'])
+        if key not in old or old[key]['seconds'] <= 0:
+            continue
+        ratio = result['seconds'] / old[key]['seconds']
+        print('{a:<22} {b:<10} x{c:<3} {d:>6.2f}x of baseline'.format(
+            a=key[0], b=key[1], c=key[2], d=ratio))
+        if ratio > threshold:
+            regressions.append('{a} {b} x{c}'.format(a=key[0], b=key[1],
+                                                     c=key[2]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--train', default='../data/esp.train')
+    parser.add_argument('--test', nargs='+',
+                        default=['../data/esp.testa', '../data/esp.testb'])
+    parser.add_argument('--scales', nargs='+', type=int,
+                        default=[1, 2, 10, 50])
+    parser.add_argument('--stages', nargs='+', default=STAGES,
+                        choices=STAGES)
+    parser.add_argument('--ftype', default='bothcon', choices=FTYPES)
+    parser.add_argument('--max-iter', type=int, default=100)
+    parser.add_argument('--hash-bits', type=int, default=None)
+    parser.add_argument('--latency-sample', type=int, default=1000,
+                        help='The number of sentences for the latency '
+                             'of the predict stage.')
+    parser.add_argument('--beams', nargs='+', type=int,
+                        default=[1, 2, 3, 5, 9],
+                        help='The beam widths of the viterbi_beam stage.')
+    parser.add_argument('--server-clients', nargs='+', type=int,
+                        default=[1, 16],
+                        help='The numbers of concurrent clients of the '
+                             'server stage.')
+    parser.add_argument('--imports', action='store_true',
+                        help='Only time the startup of the entry points.')
+    parser.add_argument('--import-repeat', type=int, default=5)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Run the stages again under tracemalloc '
+                             'for the memory peak of each stage.')
+    parser.add_argument('--output', default=None,
+                        help='Save the results into this json file.')
+    parser.add_argument('--compare', default=None,
+                        help='The json file of a baseline run.')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='The slowdown ratio treated as a regression.')
+    args = parser.parse_args()
+
+    results = []
+    if args.imports:
+        results.extend(import_times(args.import_repeat))
+        args.scales = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in args.scales:
+            train_path = scale_corpus(args.train, scale, tmp_dir)
+            test_paths = [scale_corpus(path, scale, tmp_dir)
+                          for path in args.test]
+            bench = Benchmark(train_path, test_paths, scale, args)
+            bench.run(args.stages)
+            if args.trace_memory:
+                # Tracing slows the stages down, so it has its own pass.
+                traced = Benchmark(train_path, test_paths, scale, args,
+                                   trace_memory=True)
+                traced.run(args.stages)
+                bench.add_memory(traced)
+            results.extend(bench.results)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta_info(), 'results': results}, f, indent=2)
+
+    if args.compare is not None:
+        regressions = compare(results, args.compare, args.threshold)
+        if len(regressions) != 0:
+            print('Regressions: ' + ', '.join(regressions))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# !/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Python release: 3.9 or newer, the package uses multiprocessing.shared_memory
+#                 (3.8) and tracemalloc.reset_peak (3.9).
+
+"""
+On-disk cache of the training feature matrices.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from sentence import NERDic
+import sentence
+
+
+class FeatureCache:
+    """Cache the feature matrix, the labels and the dictionary
+    of a training set as .npz files.
+
+    An entry is keyed by the content of the corpus, the ftype,
+    the feature template version and the hash bits. The least
+    recently used entries are evicted when the total size of
+    the cache is over max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes=1 << 30):
+        """Construct a new cache.
+
+        Args:
+            cache_dir: str - The directory of the cache files.
+            max_bytes: int - The maximum total size of the cache.
+        """
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path, ftype, hash_bits=None):
+        """Generate the key of a training set.
+
+        Args:
+            path: str - The path of training set.
+            ftype: str - Indicating the feature type.
+            hash_bits: int - The hash bits of the dictionary.
+
+        Returns:
+            str
+        """
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        h.update('|'.join([ftype, str(sentence.FEATURE_VERSION),
+                           str(hash_bits)]).encode('utf-8'))
+        return h.hexdigest()
+
+    def load(self, key, ortho_cache=None):
+        """Load a cache entry.
+
+        Args:
+            key: str
+            ortho_cache: OrthographicCache - The cache of the loaded
+                                             dictionary, None means
+                                             ORTHO_CACHE.
+
+        Returns:
+            None if the entry does not exist, otherwise
+            nerdic: NERDic
+            feats: scipy.sparse.csr_matrix
+            labels: list(int)
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        from scipy.sparse import csr_matrix
+        with np.load(path, allow_pickle=False) as npz:
+            shape = tuple(npz['shape'])
+            # The older entries have float32 data, which sklearn
+            # would copy at every fit.
+            data = npz['data'].astype(np.float64, copy=False)
+            feats = csr_matrix((data, npz['indices'], npz['indptr']),
+                               shape=shape)
+            labels = npz['labels'].tolist()
+            hash_bits = int(npz['hash_bits'])
+            if hash_bits >= 0:
+                nerdic = NERDic(hash_bits=hash_bits, ortho_cache=ortho_cache)
+            else:
+                nerdic = NERDic.from_vocab(npz['words'].tolist(),
+                                           npz['poss'].tolist(),
+                                           ortho_cache)
+        # Mark as recently used.
+        os.utime(path)
+        return nerdic, feats, labels
+
+    def store(self, key, nerdic, feats, labels):
+        """Store a cache entry and evict the old ones.
+
+        Args:
+            key: str
+            nerdic: NERDic
+            feats: scipy.sparse.csr_matrix
+            labels: list(int)
+        """
+        arrays = {
+                'data': feats.data,
+                'indices': feats.indices,
+                'indptr': feats.indptr,
+                'shape': np.array(feats.shape, dtype=np.int64),
+                'labels': np.array(labels, dtype=np.int8),
+                }
+        if nerdic.hashed:
+            arrays['hash_bits'] = np.array(nerdic.hash_bits)
+        else:
+            arrays['hash_bits'] = np.array(-1)
+            arrays['words'] = np.array(nerdic.words, dtype=str)
+            arrays['poss'] = np.array(nerdic.poss, dtype=str)
+
+        # A unique temporary file, so the trainers caching the same
+        # corpus at once never write into the same file.
+        fd, tmp = tempfile.mkstemp(prefix=key + '.', suffix='.tmp',
+                                   dir=self._cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, key + '.npz')
+
+    def _evict(self):
+        """Remove the least recently used entries until
+        the cache is not larger than max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self._cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self._cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Evicted by another process.
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        # Always keep the newest entry.
+        for _, size, path in entries[:-1]:
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,128 @@
+# !/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Python release: 3.9 or newer, the package uses multiprocessing.shared_memory
+#                 (3.8) and tracemalloc.reset_peak (3.9).
+
+"""
+Compress a trained NER model and report the accuracy and size deltas.
+
+The weights below the threshold are pruned, and the others are
+stored as the given dtype. Each combination of the thresholds and
+the dtypes is evaluated on the test set against the original model.
+
+Example:
+
+    python3 compress.py model.bin --thresholds 0 1e-3 1e-2 \\
+        --dtypes float32 float16 int8
+    python3 compress.py model.bin --thresholds 1e-3 --dtypes int8 \\
+        --output compact.bin
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from ner import NER
+from ner import DECODES
+from scorer import DTYPES
+
+
+def file_size(ner):
+    """Return the size of the saved model file.
+
+    Args:
+        ner: NER
+
+    Returns:
+        int - The number of bytes.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.bin')
+        ner.save(path)
+        return os.path.getsize(path)
+
+
+def measure(ner, test_path, decode):
+    """Evaluate a model and measure its size.
+
+    Args:
+        ner: NER
+        test_path: str - The path of test set.
+        decode: str - One of ner.DECODES.
+
+    Returns:
+        dict
+    """
+    overall = ner.evaluate(test_path, decode=decode).results()['overall']
+    scorer = ner.scorer
+    return {
+            'fb1': overall['fb1'],
+            'accuracy': overall['accuracy'],
+            'rows': int(scorer.weights.shape[0]),
+            'scorer_bytes': int(scorer.nbytes),
+            'file_bytes': file_size(ner),
+            }
+
+
+def format_result(result, base):
+    s = '{a:>9} {b:>8} {c:>8} rows {d:>8.2f}MB ({e:>5.1%}) '
+    s += 'file {f:>8.2f}MB ({g:>5.1%})  FB1 {h:6.2f} ({i:+.2f}) '
+    s += 'accuracy {j:6.2f} ({k:+.2f})'
+    return s.format(a=result['threshold'], b=result['dtype'],
+                    c=result['rows'], d=result['scorer_bytes'] / (1 << 20),
+                    e=result['scorer_bytes'] / base['scorer_bytes'],
+                    f=result['file_bytes'] / (1 << 20),
+                    g=result['file_bytes'] / base['file_bytes'],
+                    h=result['fb1'], i=result['fb1'] - base['fb1'],
+                    j=result['accuracy'],
+                    k=result['accuracy'] - base['accuracy'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip(),
+                                     formatter_class=argparse.
+                                     RawDescriptionHelpFormatter)
+    parser.add_argument('model', help='The model file saved by NER.save.')
+    parser.add_argument('--test', default='../data/esp.testa')
+    parser.add_argument('--thresholds', nargs='+', type=float,
+                        default=[0.0, 1e-3, 1e-2])
+    parser.add_argument('--dtypes', nargs='+', default=['float32', 'int8'],
+                        choices=DTYPES)
+    parser.add_argument('--decode', default='argmax', choices=DECODES)
+    parser.add_argument('--output', default=None,
+                        help='Save the compressed model, only for '
+                             'one threshold and one dtype.')
+    parser.add_argument('--report', default=None,
+                        help='Save the results into this json file.')
+    args = parser.parse_args()
+    if (args.output is not None and
+            len(args.thresholds) * len(args.dtypes) != 1):
+        parser.error('--output needs one threshold and one dtype.')
+
+    base = measure(NER.load(args.model), args.test, args.decode)
+    base['threshold'] = '-'
+    base['dtype'] = 'original'
+    print(format_result(base, base))
+
+    results = []
+    for threshold in args.thresholds:
+        for dtype in args.dtypes:
+            ner = NER.load(args.model)
+            ner.compress(threshold, dtype)
+            result = measure(ner, args.test, args.decode)
+            result['threshold'] = threshold
+            result['dtype'] = dtype
+            results.append(result)
+            print(format_result(result, base))
+            if args.output is not None:
+                ner.save(args.output)
+
+    if args.report is not None:
+        with open(args.report, 'w') as f:
+            json.dump({'original': base, 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+# !/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Python release: 3.9 or newer, the package uses multiprocessing.shared_memory
+#                 (3.8) and tracemalloc.reset_peak (3.9).
+
+"""
+Chunk level evaluation, the same as the conlleval script in ../bin.
+"""
+
+import collections
+import sys
+
+
+def _split(tag):
+    """Split the tag into the chunk tag and the chunk type.
+    """
+    s = tag.split('-')
+    if len(s) == 1:
+        return s[0], ''
+    return s[0], s[1]
+
+
+def _end_of_chunk(prev_tag, tag, prev_type, chunk_type):
+    if prev_tag in ('B', 'I') and tag in ('B', 'O'):
+        return True
+    if prev_tag == 'E' and tag in ('E', 'I', 'O'):
+        return True
+    if prev_tag not in ('O', '.') and prev_type != chunk_type:
+        return True
+    if prev_tag in (']', '['):
+        return True
+    return False
+
+
+def _start_of_chunk(prev_tag, tag, prev_type, chunk_type):
+    if prev_tag in ('B', 'I', 'O') and tag == 'B':
+        return True
+    if prev_tag == 'O' and tag in ('I', 'E'):
+        return True
+    if prev_tag == 'E' and tag in ('E', 'I'):
+        return True
+    if tag not in ('O', '.') and prev_type != chunk_type:
+        return True
+    if tag in ('[', ']'):
+        return True
+    return False
+
+
+class Evaluator:
+    """Incremental chunk level evaluator.
+
+    The sentences can be added one by one, for example while they
+    are predicted, and the scores are available at any time.
+    """
+    def __init__(self):
+        self._in_correct = False
+        self._last_correct = 'O'
+        self._last_correct_type = ''
+        self._last_guessed = 'O'
+        self._last_guessed_type = ''
+
+        self._correct_chunk = 0
+        self._found_correct = 0
+        self._found_guessed = 0
+        self._correct_tags = 0
+        self._token_counter = 0
+        self._correct_chunks = collections.Counter()
+        self._found_corrects = collections.Counter()
+        self._found_guesseds = collections.Counter()
+
+    def add(self, sentence):
+        """Add a sentence with predicted labels.
+
+        Args:
+            sentence: Sentence - After add_predict.
+        """
+        self.add_tags(sentence.tags, sentence.predict_tags)
+
+    def add_tags(self, corrects, guesseds):
+        """Add the tags of a sentence.
+
+        Args:
+            corrects: list(str) - The gold tags.
+            guesseds: list(str) - The predicted tags.
+        """
+        if len(corrects) != len(guesseds):
+            raise Exception('The predicted tags are not matched !')
+        for correct, guessed in zip(corrects, guesseds):
+            self._add(correct, guessed, False)
+        # The sentence boundary.
+        self._add('O', 'O', True)
+
+    def add_file(self, path):
+        """Add all the sentences of an output file.
+
+        Args:
+            path: str - The file with the gold tag and the predicted
+                        tag in the last two columns.
+        """
+        corrects = []
+        guesseds = []
+        with open(path, encoding='latin-1') as f:
+            for line in f:
+                s = line.split()
+                if len(s) == 0:
+                    self.add_tags(corrects, guesseds)
+                    corrects = []
+                    guesseds = []
+                    continue
+                corrects.append(s[-2])
+                guesseds.append(s[-1])
+        # The last sentence without a boundary.
+        for correct, guessed in zip(corrects, guesseds):
+            self._add(correct, guessed, False)
+
+    def results(self):
+        """Compute the scores.
+
+        Returns:
+            dict - The overall scores and the scores of each type.
+        """
+        correct_chunk = self._correct_chunk
+        if self._in_correct:
+            # The last chunk is still open.
+            correct_chunk += 1
+
+        overall = self._scores(correct_chunk, self._found_guessed,
+                               self._found_correct)
+        accuracy = 0.0
+        if self._token_counter > 0:
+            accuracy = 100 * self._correct_tags / self._token_counter
+        overall['accuracy'] = accuracy
+        overall['tokens'] = self._token_counter
+        overall['phrases'] = self._found_correct
+        overall['found'] = self._found_guessed
+        overall['correct'] = correct_chunk
+
+        correct_chunks = collections.Counter(self._correct_chunks)
+        if self._in_correct:
+            correct_chunks[self._last_correct_type] += 1
+        types = dict()
+        for t in sorted(set(self._found_corrects) |
+                        set(self._found_guesseds)):
+            types[t] = self._scores(correct_chunks[t],
+                                    self._found_guesseds[t],
+                                    self._found_corrects[t])
+        return {'overall': overall, 'types': types}
+
+    def report(self):
+        """Format the scores the same way as conlleval.
+
+        Returns:
+            str
+        """
+        results = self.results()
+        overall = results['overall']
+        lines = []
+        s = 'processed {a} tokens with {b} phrases; '
+        s += 'found: {c} phrases; correct: {d}.'
+        lines.append(s.format(a=overall['tokens'], b=overall['phrases'],
+                              c=overall['found'], d=overall['correct']))
+        if overall['tokens'] > 0:
+            s = 'accuracy: {a:6.2f}%; precision: {b:6.2f}%; '
+            s += 'recall: {c:6.2f}%; FB1: {d:6.2f}'
+            lines.append(s.format(a=overall['accuracy'],
+                                  b=overall['precision'],
+                                  c=overall['recall'], d=overall['fb1']))
+        for t, scores in results['types'].items():
+            s = '{a:>17}: precision: {b:6.2f}%; '
+            s += 'recall: {c:6.2f}%; FB1: {d:6.2f}'
+            lines.append(s.format(a=t, b=scores['precision'],
+                                  c=scores['recall'], d=scores['fb1']))
+        return '\n'.join(lines) + '\n'
+
+    ########################################################
+    # Private methods
+    ########################################################
+    def _add(self, correct, guessed, boundary):
+        """Process one line of the conlleval input.
+
+        Args:
+            correct: str - The gold tag.
+            guessed: str - The predicted tag.
+            boundary: bool - Whether it is a sentence boundary.
+        """
+        guessed, guessed_type = _split(guessed)
+        correct, correct_type = _split(correct)
+        last_correct = self._last_correct
+        last_correct_type = self._last_correct_type
+        last_guessed = self._last_guessed
+        last_guessed_type = self._last_guessed_type
+
+        correct_end = _end_of_chunk(last_correct, correct,
+                                    last_correct_type, correct_type)
+        guessed_end = _end_of_chunk(last_guessed, guessed,
+                                    last_guessed_type, guessed_type)
+        correct_start = _start_of_chunk(last_correct, correct,
+                                        last_correct_type, correct_type)
+        guessed_start = _start_of_chunk(last_guessed, guessed,
+                                        last_guessed_type, guessed_type)
+
+        if self._in_correct:
+            if (correct_end and guessed_end and
+                    last_guessed_type == last_correct_type):
+                self._in_correct = False
+                self._correct_chunk += 1
+                self._correct_chunks[last_correct_type] += 1
+            elif correct_end != guessed_end or guessed_type != correct_type:
+                self._in_correct = False
+
+        if correct_start and guessed_start and guessed_type == correct_type:
+            self._in_correct = True
+
+        if correct_start:
+            self._found_correct += 1
+            self._found_corrects[correct_type] += 1
+        if guessed_start:
+            self._found_guessed += 1
+            self._found_guesseds[guessed_type] += 1
+        if not boundary:
+            if correct == guessed and guessed_type == correct_type:
+                self._correct_tags += 1
+            self._token_counter += 1
+
+        self._last_guessed = guessed
+        self._last_correct = correct
+        self._last_guessed_type = guessed_type
+        self._last_correct_type = correct_type
+
+    def _scores(self, correct, guessed, found):
+        """Compute precision, recall and FB1.
+
+        Args:
+            correct: int - The number of correct chunks.
+            guessed: int - The number of predicted chunks.
+            found: int - The number of gold chunks.
+        """
+        precision = 0.0
+        recall = 0.0
+        fb1 = 0.0
+        if guessed > 0:
+            precision = 100 * correct / guessed
+        if found > 0:
+            recall = 100 * correct / found
+        if precision + recall > 0:
+            fb1 = 2 * precision * recall / (precision + recall)
+        return {'precision': precision, 'recall': recall, 'fb1': fb1}
+
+
+if __name__ == '__main__':
+    evaluator = Evaluator()
+    evaluator.add_file(sys.argv[1])
+    sys.stdout.write(evaluator.report())
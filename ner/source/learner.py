@@ -11,9 +11,11 @@
 
 """
 Wrapper for the classifier.
+
+sklearn is only imported when a classifier is trained, so the
+models loaded from a file and the HMM path start without it.
 """
 
-from sklearn import svm
 # from sklearn.ensemble import RandomForestClassifier
 # from sklearn.ensemble import AdaBoostClassifier
 
@@ -28,6 +30,8 @@ class Learner:
             max_iter: int - The maximum iterations.
         """
         self._max_iter = max_iter
+        self._coef = None
+        self._intercept = None
 
     def train(self, x, y):
         """Train the model using the featture x and label y.
@@ -36,12 +40,15 @@ class Learner:
             x: scipy.sparse.csr_matrix - The features matrix in sparse format.
             y: list(int) - Labels for each instance.
         """
+        from sklearn import svm
         self._clf = svm.LinearSVC(max_iter=self._max_iter,
                                   # class_weight='balanced',
                                   )
         # self._clf = RandomForestClassifier(n_estimators=40, n_jobs=-1)
         # self._clf = AdaBoostClassifier(n_estimators=100)
         self._clf.fit(x, y)
+        self._coef = self._clf.coef_[0]
+        self._intercept = self._clf.intercept_[0]
 
     def predict(self, feats):
         """Predict the label based on the features.
@@ -53,12 +60,16 @@ class Learner:
         Returns:
             list(int)
         """
-        predict = self._clf.predict(feats)
+        predict = (self.confidence(feats) > 0).astype(int)
         return predict
 
     def confidence(self, feats):
         """Predict the confidence for each class.
 
+        The same as the decision_function of the classifier,
+        computed from the weights so that it also works for
+        the weights loaded from a model file.
+
         Args:
             feats: scipy.sparse.csr_matrix - The features matrix
                    in sparse format.
@@ -66,7 +77,72 @@ class Learner:
         Returns:
             list(int)
         """
-        confidence = self._clf.decision_function(feats)
+        confidence = feats.dot(self._coef) + self._intercept
         # confidence = self._clf.predict_proba(feats)
         # confidence = [max(v) for v in confidence]
         return confidence
+
+    def set_weights(self, coef, intercept):
+        """Use the given weights instead of training.
+
+        Args:
+            coef: numpy.ndarray - The weight of each feature.
+            intercept: float - The bias.
+        """
+        self._coef = coef
+        self._intercept = intercept
+
+    ########################################################
+    # Property
+    ########################################################
+    @property
+    def coef(self):
+        return self._coef
+
+    @property
+    def intercept(self):
+        return self._intercept
+
+
+class IncrementalLearner(Learner):
+    """Classifier trained incrementally on minibatches.
+
+    It minimizes the hinge loss with SGD, the same loss as LinearSVC,
+    so the training set never has to be in memory at once.
+    """
+    def __init__(self, max_iter=100, alpha=1e-5):
+        """Construct a new classifier.
+
+        Args:
+            max_iter: int - The maximum iterations of train.
+            alpha: float - The regularization strength.
+        """
+        super().__init__(max_iter)
+        self._alpha = alpha
+        self._clf = None
+
+    def train(self, x, y):
+        """Train the model using the featture x and label y.
+
+        Args:
+            x: scipy.sparse.csr_matrix - The features matrix in sparse format.
+            y: list(int) - Labels for each instance.
+        """
+        self._clf = None
+        self.partial_train(x, y)
+
+    def partial_train(self, x, y):
+        """Update the model with one minibatch.
+
+        Args:
+            x: scipy.sparse.csr_matrix - The features matrix in sparse format.
+            y: list(int) - Binary labels for each instance.
+        """
+        if self._clf is None:
+            from sklearn import linear_model
+            self._clf = linear_model.SGDClassifier(
+                    loss='hinge', alpha=self._alpha,
+                    max_iter=self._max_iter)
+        self._clf.partial_fit(x, y, classes=[0, 1])
+        self._coef = self._clf.coef_[0]
+        self._intercept = self._clf.intercept_[0]
@@ -13,15 +13,33 @@
 Main entrance fo the NER system.
 """
 
+import time
+
 import numpy as np
-from scipy.sparse import csr_matrix
 
 from utils import IOManager
 from sentence import NERDic
+from sentence import OrthographicCache
 from sentence import Sentence
 from learner import Learner
+from learner import IncrementalLearner
 import sentence
+import parallel
+import artifact
+from cache import FeatureCache
+from evaluate import Evaluator
 from viterbi import Viterbi
+import viterbi as decoder
+from profiler import Profiler
+from profiler import profiled
+from scorer import LinearScorer
+
+DECODES = ['argmax', 'bio', 'trans']
+# The default weight of the learned transitions against the learner
+# confidences, see NER.tune_trans_weight.
+TRANS_WEIGHT = 0.1
+# The weights tried by NER.tune_trans_weight.
+TRANS_WEIGHTS = [0.02, 0.05, 0.1, 0.2, 0.5, 1.0]
 
 
 class NER:
@@ -41,12 +59,61 @@ class NER:
     5.bothcon: use ALL of the features above: the wordcap features,
                the POS context features, and the lexical context features.
     """
-    def __init__(self, max_iter=100):
+    def __init__(self, max_iter=100, n_jobs=1, chunk_size=500,
+                 hash_bits=None, cache_dir=None, cache_size=1 << 30,
+                 profile=None, profile_dir=None, profile_details=None,
+                 ortho_cache_size=None):
+        """Construct a new NER system.
+
+        Args:
+            max_iter: int - The maximum iterations of each learner.
+            n_jobs: int - The number of processes used for feature
+                          extraction and training, -1 means all the cores.
+            chunk_size: int - The number of sentences sent to a
+                              feature extraction process at a time.
+            hash_bits: int - Use a hashed feature space of 2**hash_bits
+                             ids instead of the training vocabulary.
+            cache_dir: str - The directory to cache the training features,
+                             None means no cache.
+            cache_size: int - The maximum size of the cache in bytes.
+            profile: bool - Write a profile report of each run,
+                            None means enabled if NER_PROFILE is set.
+            profile_dir: str - The directory of the profile reports.
+            profile_details: list(str) - Some of profiler.DETAILS,
+                                         None means NER_PROFILE_DETAILS.
+            ortho_cache_size: int - The maximum number of words whose
+                                    orthographic features are cached,
+                                    None means the unbounded cache
+                                    shared by the process.
+        """
         self._io = IOManager()
+        self._max_iter = max_iter
+        self._n_jobs = n_jobs
+        self._chunk_size = chunk_size
+        self._hash_bits = hash_bits
+        self._nerdic = None
+        self._ftype = None
+        self._viterbi = None
+        # The label transition scores learned from the training set.
+        self._transitions = None
+        self._trans_weight = TRANS_WEIGHT
+        self._cache = None
+        if cache_dir is not None:
+            self._cache = FeatureCache(cache_dir, cache_size)
+        self._profiler = Profiler(profile, profile_dir, profile_details)
+        # A bounded cache for the streaming and long-running uses.
+        self._ortho_cache = None
+        if ortho_cache_size is not None:
+            self._ortho_cache = OrthographicCache(ortho_cache_size)
+        # The stacked learner weights, built on first use.
+        self._scorer = None
+        # The feature table reused by tag, it grows by doubling.
+        self._feature_buffer = np.empty(0, dtype=np.int64)
         self._learners = []
         for i in range(len(sentence.REVERSE_LABELS)):
             self._learners.append(Learner(max_iter=max_iter))
 
+    @profiled('train')
     def train(self, train_path, ftype):
         """Train the NER model.
 
@@ -54,28 +121,24 @@ class NER:
             train_path: str - The path of training set.
             ftype: str - Indicating the feature type.
         """
-        self._nerdic = NERDic(train_path)
-        io = self._io
-        sentences = []
-
-        # reading the training set.
-        for words, poss, labels in io.read_sentences(train_path):
-            sentences.append(Sentence(labels, words, poss, self._nerdic))
-
-        feats, labels = self._prepare_feats(sentences, ftype)
-
-        sep_labels = []
-        for i in sentence.REVERSE_LABELS.keys():
-            sep_labels.append([])
-            for label in labels:
-                if label == i:
-                    sep_labels[i].append(1)
-                else:
-                    sep_labels[i].append(0)
+        profiler = self._profiler
+        feats, labels = self._load_feats(train_path, ftype)
+        labels = np.array(labels, dtype=np.int64)
+        self._record_sizes(feats)
 
         print('Start first phase training...')
-        for i, learner in enumerate(self._learners):
-            learner.train(feats, sep_labels[i])
+        if parallel.resolve_jobs(self._n_jobs) > 1:
+            with profiler.stage('learner_train'):
+                self._learners = parallel.train_learners(
+                        self._learners, feats, labels, self._n_jobs)
+        else:
+            for i, learner in enumerate(self._learners):
+                with profiler.stage('learner_train'):
+                    learner.train(feats, (labels == i).astype(np.int64))
+        self._scorer = None
+        with profiler.stage('transitions'):
+            self._train_transitions(train_path)
+        self._ftype = ftype
 
         # print('Start second phase training...')
         # second_feats = []
@@ -87,44 +150,397 @@ class NER:
         # self._second_learner = Learner(max_iter=1000)
         # self._second_learner.train(second_feats, labels)
 
-    def predict(self, test_path, output_path, ftype):
+    @profiled('train_stream')
+    def train_stream(self, train_path, ftype, epochs=5, batch_size=1000,
+                     alpha=1e-5):
+        """Train the NER model out of core.
+
+        The training set is read in minibatches of sentences, which
+        are fed to incremental learners, so the memory is bounded by
+        the batch size instead of the corpus size. The feature space is
+        fixed before training: hashed if hash_bits is given, otherwise
+        the vocabulary of the training set.
+
+        Args:
+            train_path: str - The path of training set.
+            ftype: str - Indicating the feature type.
+            epochs: int - The number of passes over the training set.
+            batch_size: int - The number of sentences in one minibatch.
+            alpha: float - The regularization strength of the learners.
+        """
+        profiler = self._profiler
+        with profiler.stage('nerdic'):
+            self._nerdic = NERDic(train_path, self._hash_bits,
+                                  ortho_cache=self._ortho_cache)
+        self._learners = [IncrementalLearner(self._max_iter, alpha)
+                          for _ in range(len(sentence.REVERSE_LABELS))]
+        for epoch in range(epochs):
+            print('Start epoch {a}...'.format(a=epoch+1))
+            chunks = self._io.read_chunks(train_path, batch_size)
+            for items in profiler.iterate('read', chunks):
+                sentences = [Sentence(labels, words, poss, self._nerdic)
+                             for words, poss, labels in items]
+                feats, labels = self._prepare_feats(sentences, ftype)
+                labels = np.array(labels, dtype=np.int64)
+                for i, learner in enumerate(self._learners):
+                    with profiler.stage('learner_train'):
+                        learner.partial_train(
+                                feats, (labels == i).astype(np.int64))
+        self._scorer = None
+        self._record_sizes()
+        with profiler.stage('transitions'):
+            self._train_transitions(train_path)
+        self._ftype = ftype
+
+    @profiled('predict')
+    def predict(self, test_path, output_path, ftype=None, chunk_size=1000,
+                decode='argmax'):
         """Predict the test set.
 
+        The test set is read, featurized, scored and written
+        chunk by chunk, so the memory does not grow with its size.
+
         Args:
             test_path: str - The path of test set.
             output_path: str - The path of output file.
+            ftype: str - Indicating the feature type,
+                         None means the one used for training.
+            chunk_size: int - The number of sentences in one chunk.
+            decode: str - One of DECODES.
+
+        Return:
+            int - The number of predicted sentences.
+        """
+        sentences = self.iter_predict(test_path, ftype, chunk_size, decode)
+        return self._io.write_sentences(output_path, sentences)
+
+    def iter_predict(self, test_path, ftype=None, chunk_size=1000,
+                     decode='argmax'):
+        """Predict the test set lazily.
+
+        Each learner is called once per chunk.
+
+        Args:
+            test_path: str - The path of test set.
+            ftype: str - Indicating the feature type,
+                         None means the one used for training.
+            chunk_size: int - The number of sentences in one chunk.
+            decode: str - One of DECODES:
+                          argmax: the best label of each token.
+                          bio: the best sequence under the BIO constraint.
+                          trans: the best sequence with the label
+                                 transitions learned from training.
+
+        Yields:
+            Sentence - The sentence with predicted labels.
+        """
+        if ftype is None:
+            ftype = self._ftype
+        chunks = self._io.read_chunks(test_path, chunk_size)
+        for items in self._profiler.iterate('read', chunks):
+            chunk = [Sentence(labels, words, poss, self._nerdic)
+                     for words, poss, labels in items]
+            predicts = self._predict_ids(chunk, ftype, decode)
+            for sent, predict_ids in zip(chunk, predicts):
+                sent.add_predict(predict_ids)
+                yield sent
+
+    @profiled('evaluate')
+    def evaluate(self, test_path, ftype=None, chunk_size=1000, viterbi=False,
+                 decode='argmax'):
+        """Predict the test set and score it in memory, the same
+        way as the conlleval script.
+
+        Args:
+            test_path: str - The path of test set.
+            ftype: str - Indicating the feature type,
+                         None means the one used for training.
+            chunk_size: int - The number of sentences in one chunk.
+            viterbi: bool - Use the HMM model instead of the learners.
+            decode: str - One of DECODES.
+
+        Return:
+            Evaluator
+        """
+        if viterbi:
+            sentences = self.iter_predict_viterbi(test_path, chunk_size)
+        else:
+            sentences = self.iter_predict(test_path, ftype, chunk_size,
+                                          decode)
+        evaluator = Evaluator()
+        for sent in sentences:
+            evaluator.add(sent)
+        return evaluator
+
+    def tune_trans_weight(self, dev_path, weights=None):
+        """Choose the weight of the learned transitions on a
+        development set, the weight with the best FB1 is kept.
+
+        Args:
+            dev_path: str - The path of development set.
+            weights: list(float) - The weights to try,
+                                   None means TRANS_WEIGHTS.
+
+        Return:
+            dict(float, float) - The FB1 of each weight.
+        """
+        if weights is None:
+            weights = TRANS_WEIGHTS
+        scores = dict()
+        for weight in weights:
+            self.trans_weight = weight
+            evaluator = self.evaluate(dev_path, decode='trans')
+            scores[weight] = evaluator.results()['overall']['fb1']
+        self.trans_weight = max(weights, key=lambda w: scores[w])
+        return scores
+
+    @property
+    def trans_weight(self):
+        """The weight of the learned transitions in the trans decode,
+        saved with the model.
+        """
+        return self._trans_weight
+
+    @trans_weight.setter
+    def trans_weight(self, weight):
+        if weight < 0:
+            raise Exception('The transition weight is negative !')
+        self._trans_weight = weight
+
+    @property
+    def scorer(self):
+        """The LinearScorer of the trained learners,
+        the compressed one after compress.
+        """
+        if self._ftype is None:
+            raise Exception('The model is not trained !')
+        return self._linear_scorer()
+
+    def tag(self, words, poss, decode='argmax'):
+        """Tag one sentence in memory.
+
+        The feature table and the confidences are written into the
+        buffers of the NER system, so it must not be shared by threads.
+
+        Args:
+            words: list(str)
+            poss: list(str)
+            decode: str - One of DECODES.
+
+        Return:
+            list(str) - The label of each word.
+        """
+        sent = Sentence(['O'] * len(words), words, poss, self._nerdic)
+        if len(sent) == 0:
+            return []
+        size = len(sent) * Sentence.feature_width(self._ftype)
+        if len(self._feature_buffer) < size:
+            self._feature_buffer = np.empty(
+                    max(size, 2 * len(self._feature_buffer)), dtype=np.int64)
+        lengths, indices = sent.feature_arrays(self._ftype,
+                                               self._feature_buffer)
+        confidence = self._linear_scorer().score(lengths, indices)
+        ids = self._decode(confidence, [len(sent)], decode)[0]
+        tags = sentence.REVERSE_LABELS
+        return [tags[i] for i in ids]
+
+    def tag_many(self, sentences, decode='argmax'):
+        """Tag many sentences in memory, in one batch.
+
+        Args:
+            sentences: list((list(str), list(str))) - The words and
+                                                      poss of each sentence.
+            decode: str - One of DECODES.
+
+        Return:
+            list(list(str)) - The labels of each sentence.
+        """
+        lengths = []
+        indices = []
+        for words, poss in sentences:
+            sent = Sentence(['O'] * len(words), words, poss, self._nerdic)
+            length, index = sent.feature_arrays(self._ftype)
+            lengths.append(length)
+            indices.append(index)
+        if len(lengths) == 0:
+            return []
+        confidence = self._linear_scorer().score(np.concatenate(lengths),
+                                                 np.concatenate(indices))
+        predicts = self._decode(confidence,
+                                [len(words) for words, _ in sentences],
+                                decode)
+        tags = sentence.REVERSE_LABELS
+        return [[tags[i] for i in ids] for ids in predicts]
+
+    def _load_feats(self, train_path, ftype):
+        """Build the dictionary and the features of the training set,
+        or load them from the cache.
+
+        Args:
+            train_path: str - The path of training set.
             ftype: str - Indicating the feature type.
 
         Return:
-            list(Sentence) - The sentence with predicted labels.
+            feats: scipy.sparse.csr_matrix
+            lables: list(int)
         """
-        # reading the training set.
+        cache = self._cache
+        profiler = self._profiler
+        if cache is not None:
+            with profiler.stage('cache_load'):
+                key = cache.key(train_path, ftype, self._hash_bits)
+                item = cache.load(key, self._ortho_cache)
+            if item is not None:
+                self._nerdic, feats, labels = item
+                return feats, labels
+
+        with profiler.stage('nerdic'):
+            self._nerdic = NERDic(train_path, self._hash_bits,
+                                  ortho_cache=self._ortho_cache)
         io = self._io
-        sentences = []
-        for words, poss, labels in io.read_sentences(test_path):
-            sentences.append(Sentence(labels, words, poss, self._nerdic))
+        if parallel.resolve_jobs(self._n_jobs) > 1:
+            chunks = io.read_chunks(train_path, self._chunk_size)
+            with profiler.stage('featurize'):
+                items = parallel.featurize(chunks, self._nerdic, ftype,
+                                           self._n_jobs)
+            with profiler.stage('csr'):
+                feats, labels = self._build_csr(*items)
+        else:
+            sentences = []
+            # reading the training set.
+            with profiler.stage('read'):
+                for words, poss, labels in io.read_sentences(train_path):
+                    sentences.append(
+                            Sentence(labels, words, poss, self._nerdic))
+            feats, labels = self._prepare_feats(sentences, ftype)
+
+        if cache is not None:
+            with profiler.stage('cache_store'):
+                cache.store(key, self._nerdic, feats, labels)
+        return feats, labels
 
-        for sent in sentences:
-            feats, labels = self._prepare_feats([sent], ftype)
-            confidence = []
-            predict_ids = []
-            for learner in self._learners:
-                confidence.append(learner.confidence(feats))
+    def _predict_ids(self, sentences, ftype, decode='argmax'):
+        """Predict the label ids of a batch of sentences.
 
-            confidence = np.array(confidence)
-            confidence = confidence.transpose()
+        Args:
+            sentences: list(Sentence)
+            ftype: str - Indicating the type of features.
+            decode: str - One of DECODES.
 
-            for con in confidence:
-                predict_ids.append(np.argmax(con))
+        Return:
+            list(list(int)) - The label ids of each sentence.
+        """
+        profiler = self._profiler
+        with profiler.stage('featurize'):
+            _, lengths, indices = sentence.featurize(sentences, ftype)
+        with profiler.stage('score'):
+            confidence = self._linear_scorer().score(lengths, indices)
+        with profiler.stage('decode'):
+            return self._decode(confidence,
+                                [len(sent) for sent in sentences], decode)
+
+    def _decode(self, confidence, sizes, decode):
+        """Turn the confidences into the label ids of each sentence.
 
-            # predict_ids = self._second_learner.predict(confidence)
-            sent.add_predict(predict_ids)
+        Args:
+            confidence: numpy.ndarray - (tokens x labels) confidences.
+            sizes: list(int) - The number of tokens of each sentence.
+            decode: str - One of DECODES.
 
-        io.write_sentences(output_path, sentences)
+        Return:
+            list(list(int))
+        """
+        if decode != 'argmax':
+            # One viterbi pass over the confidences of the whole batch.
+            trans, start, end = self._decode_tables(decode)
+            return decoder.decode_concat(confidence, sizes, trans, start, end)
+        predict_ids = confidence.argmax(axis=1).tolist()
+        # predict_ids = self._second_learner.predict(confidence)
+
+        # Split the rows back into sentences.
+        reval = []
+        begin = 0
+        for size in sizes:
+            reval.append(predict_ids[begin:begin+size])
+            begin += size
+        return reval
+
+    def _linear_scorer(self):
+        """Return the scorer of the learner weights.
+
+        Return:
+            LinearScorer
+        """
+        if self._scorer is None:
+            self._scorer = LinearScorer.from_learners(self._learners)
+        return self._scorer
+
+    def _record_sizes(self, feats=None):
+        """Record the sizes of the dictionary and the feature matrix
+        in the profile report.
+
+        Args:
+            feats: scipy.sparse.csr_matrix
+        """
+        profiler = self._profiler
+        nerdic = self._nerdic
+        profiler.size('nerdic.features', nerdic.max_id() + 1)
+        if not nerdic.hashed:
+            profiler.size('nerdic.words', nerdic.distinct_word_num)
+            profiler.size('nerdic.poss', nerdic.distinct_pos_num)
+        if feats is not None:
+            profiler.size('feats.rows', feats.shape[0])
+            profiler.size('feats.nnz', int(feats.nnz))
+            profiler.size('feats.bytes', int(feats.data.nbytes +
+                                             feats.indices.nbytes +
+                                             feats.indptr.nbytes))
+
+    def _train_transitions(self, train_path):
+        """Learn the label transition scores of the training set.
+
+        Args:
+            train_path: str - The path of training set.
+        """
+        label_seqs = ([sentence.LABELS[label] for label in labels]
+                      for _, _, labels in self._io.read_sentences(train_path))
+        counts = decoder.count_transitions(label_seqs,
+                                           len(sentence.REVERSE_LABELS))
+        self._transitions = decoder.log_transitions(counts)
+
+    def _decode_tables(self, decode):
+        """Return the transition scores of a decode mode.
+
+        The learned transitions are log-probabilities, they are scaled
+        by trans_weight to the range of the learner confidences.
+
+        Args:
+            decode: str - One of DECODES except argmax.
+
+        Return:
+            trans: numpy.ndarray - (labels x labels) scores.
+            start: numpy.ndarray - The START transition scores.
+            end: numpy.ndarray - The END transition scores.
+        """
+        tags = [sentence.REVERSE_LABELS[i]
+                for i in range(len(sentence.REVERSE_LABELS))]
+        if decode == 'bio':
+            return decoder.bio_constraint(tags)
+        if decode == 'trans':
+            if self._transitions is None:
+                raise Exception('The label transitions are not trained !')
+            weight = self._trans_weight
+            return tuple(weight * table for table in self._transitions)
+        raise Exception('Unknown decode mode: {a} !'.format(a=decode))
 
     def _prepare_feats(self, sentences, ftype):
         """Prepare the feartures
 
+        The feature ids are written straight into the indptr/indices
+        arrays of the csr_matrix. All the features are binary indicators.
+        The data is float64, the dtype liblinear is fitted with, so no
+        fit copies the matrix and the shared memory of the workers is
+        used as it is.
+
         Args:
             sentences: list(Sentence)
             ftype: str - Indicating the type of features.
@@ -134,51 +550,239 @@ class NER:
             feats: scipy.sparse.csr_matrix
         """
         # Extracting the features
-        labels = []
-        feats = []
-        for sent in sentences:
-            # items = sent.generate_keys(ftype)
-            # print(items[5])
-            # exit()
-            items = sent.generate_features(ftype)
-            for label, feat in items:
-                labels.append(label)
-                feats.append(feat)
+        with self._profiler.stage('featurize'):
+            labels, lengths, indices = sentence.featurize(sentences, ftype)
+        with self._profiler.stage('csr'):
+            return self._build_csr(labels, lengths, indices)
+
+    def _build_csr(self, labels, lengths, indices):
+        """Build the csr_matrix from the extracted features.
+
+        Args:
+            labels: numpy.ndarray - The label id of each token.
+            lengths: numpy.ndarray - The number of features of each token.
+            indices: numpy.ndarray - The feature ids of all the tokens.
+
+        Return:
+            feats: scipy.sparse.csr_matrix
+            lables: list(int)
+        """
+        from scipy.sparse import csr_matrix
+
         # Prepare for the scipy spase format.
-        rows = []
-        cols = []
-        data = []
-        for i in range(len(feats)):
-            for v in feats[i]:
-                rows.append(i)
-                cols.append(v)
-                data.append(1)
-        M = len(feats)
+        M = len(labels)
         N = self._nerdic.max_id() + 1
-        feats = csr_matrix((data, (rows, cols)), shape=(M, N),
-                           dtype=np.float64)
+        indptr = np.zeros(M+1, dtype=np.int32)
+        np.cumsum(lengths, out=indptr[1:])
+        data = np.ones(len(indices), dtype=np.float64)
+        feats = csr_matrix((data, indices, indptr), shape=(M, N))
 
-        return feats, labels
+        return feats, labels.tolist()
 
+    @profiled('viterbi')
     def viterbi(self, train_path, test_path, output_path):
+        """Train the HMM model and decode the test set with viterbi.
 
-        self._nerdic = NERDic(train_path)
+        Args:
+            train_path: str - The path of training set.
+            test_path: str - The path of test set.
+            output_path: str - The path of output file.
+        """
+        self.train_viterbi(train_path)
+        self.predict_viterbi(test_path, output_path)
+
+    @profiled('train_viterbi')
+    def train_viterbi(self, train_path):
+        """Train the HMM model.
+
+        Args:
+            train_path: str - The path of training set.
+        """
         io = self._io
+        profiler = self._profiler
         train_sentences = []
-        test_sentences = []
-        for words, poss, labels in io.read_sentences(train_path):
-            train_sentences.append(Sentence(labels, words, poss, self._nerdic))
+        with profiler.stage('read'):
+            for words, poss, labels in io.read_sentences(train_path):
+                train_sentences.append(
+                        Sentence(labels, words, poss, self._nerdic))
+
+        viterbi = Viterbi(len(sentence.REVERSE_LABELS))
+        with profiler.stage('viterbi_train'):
+            viterbi.train(train_sentences)
+            viterbi.compile()
+        self._viterbi = viterbi
+        profiler.size('viterbi.observations', len(viterbi.observations))
+        profiler.size('viterbi.bytes', sum(
+            arr.nbytes for arr in viterbi.tables().values()))
+
+    @profiled('predict_viterbi')
+    def predict_viterbi(self, test_path, output_path, chunk_size=1000):
+        """Decode the test set with the HMM model.
+
+        Args:
+            test_path: str - The path of test set.
+            output_path: str - The path of output file.
+            chunk_size: int - The number of sentences in one chunk.
 
-        for words, poss, labels in io.read_sentences(test_path):
-            test_sentences.append(Sentence(labels, words, poss, self._nerdic))
+        Return:
+            int - The number of decoded sentences.
+        """
+        begin = time.time()
+        sentences = self.iter_predict_viterbi(test_path, chunk_size)
+        count = self._io.write_sentences(output_path, sentences)
+        elapsed = time.time() - begin
+        if elapsed > 0:
+            print('Decoded {a:.1f} sentences/sec.'.format(a=count/elapsed))
+        return count
 
-        viterbi = Viterbi(9)
-        viterbi.train(train_sentences)
-        for sent in test_sentences:
-            predict_ids = viterbi.search(sent)
-            sent.add_predict(predict_ids)
+    def iter_predict_viterbi(self, test_path, chunk_size=1000):
+        """Decode the test set with the HMM model lazily.
 
-        io.write_sentences(output_path, test_sentences)
+        Args:
+            test_path: str - The path of test set.
+            chunk_size: int - The number of sentences in one chunk.
+
+        Yields:
+            Sentence - The sentence with predicted labels.
+        """
+        viterbi = self._viterbi
+        profiler = self._profiler
+        chunks = self._io.read_chunks(test_path, chunk_size)
+        for items in profiler.iterate('read', chunks):
+            chunk = [Sentence(labels, words, poss, self._nerdic)
+                     for words, poss, labels in items]
+            with profiler.stage('viterbi_search'):
+                predicts = viterbi.search_batch(chunk)
+            for sent, predict_ids in zip(chunk, predicts):
+                sent.add_predict(predict_ids)
+                yield sent
+
+    def compress(self, threshold=0.0, dtype='float64'):
+        """Prune and quantize the weights used for scoring,
+        see LinearScorer.compress.
+
+        The learners keep their weights until the model is saved,
+        a saved compressed model only has the compressed ones.
+
+        Args:
+            threshold: float - The weights whose absolute values are
+                               smaller than it are set to zero.
+            dtype: str - One of scorer.DTYPES.
+        """
+        if self._ftype is None:
+            raise Exception('The model is not trained !')
+        self._scorer = self._linear_scorer().compress(threshold, dtype)
+
+    def save(self, path):
+        """Save the dictionary, the learner weights and
+        the viterbi tables into one model file.
+
+        Args:
+            path: str - The path of the model file.
+        """
+        meta = {
+                'max_iter': self._max_iter,
+                'hash_bits': self._hash_bits,
+                'ftype': self._ftype,
+                'labels': [sentence.REVERSE_LABELS[i]
+                           for i in range(len(sentence.REVERSE_LABELS))],
+                'viterbi': self._viterbi is not None,
+                'transitions': self._transitions is not None,
+                'trans_weight': self._trans_weight,
+                }
+        arrays = dict()
+        nerdic = self._nerdic
+        if nerdic is not None and not nerdic.hashed:
+            arrays['dic.words'] = artifact.pack_strings(nerdic.words)
+            arrays['dic.poss'] = artifact.pack_strings(nerdic.poss)
+        meta['dic'] = nerdic is not None
+
+        meta['compressed'] = (self._scorer is not None and
+                              self._scorer.compressed)
+        if meta['compressed']:
+            for name, arr in self._scorer.arrays().items():
+                arrays['scorer.' + name] = arr
+        elif self._ftype is not None:
+            # (n_features x labels), one row for each feature.
+            arrays['learners.coef'] = np.column_stack(
+                    [learner.coef for learner in self._learners])
+            arrays['learners.intercept'] = np.array(
+                    [learner.intercept for learner in self._learners],
+                    dtype=np.float64)
+
+        if self._transitions is not None:
+            for name, arr in zip(('trans', 'start', 'end'),
+                                 self._transitions):
+                arrays['transitions.' + name] = arr
+
+        if self._viterbi is not None:
+            for name, arr in self._viterbi.tables().items():
+                arrays['viterbi.' + name] = arr
+            arrays['viterbi.observations'] = artifact.pack_strings(
+                    self._viterbi.observations)
+
+        artifact.write(path, meta, arrays)
+
+    @classmethod
+    def load(cls, path, mmap=True, ortho_cache_size=None):
+        """Load a model saved by NER.save.
+
+        Args:
+            path: str - The path of the model file.
+            mmap: bool - Memory-map the weights instead of reading them,
+                         so several processes share one copy.
+            ortho_cache_size: int - See NER.__init__.
+
+        Returns:
+            NER
+        """
+        meta, arrays = artifact.read(path, mmap)
+        labels = [sentence.REVERSE_LABELS[i]
+                  for i in range(len(sentence.REVERSE_LABELS))]
+        if meta['labels'] != labels:
+            raise Exception('The labels of the model are not matched !')
+
+        ner = cls(max_iter=meta['max_iter'], hash_bits=meta['hash_bits'],
+                  ortho_cache_size=ortho_cache_size)
+        if meta['dic'] and meta['hash_bits'] is not None:
+            ner._nerdic = NERDic(hash_bits=meta['hash_bits'],
+                                 ortho_cache=ner._ortho_cache)
+        elif meta['dic']:
+            ner._nerdic = NERDic.from_vocab(
+                    artifact.unpack_strings(arrays['dic.words']),
+                    artifact.unpack_strings(arrays['dic.poss']),
+                    ner._ortho_cache)
+
+        if meta.get('compressed'):
+            # The learners have no weights, only the scorer is used.
+            ner._ftype = meta['ftype']
+            ner._scorer = LinearScorer(arrays['scorer.weights'],
+                                       arrays['scorer.bias'],
+                                       row_map=arrays.get('scorer.row_map'),
+                                       scale=arrays.get('scorer.scale'))
+        elif meta['ftype'] is not None:
+            ner._ftype = meta['ftype']
+            coef = arrays['learners.coef']
+            intercept = arrays['learners.intercept']
+            for i, learner in enumerate(ner._learners):
+                learner.set_weights(coef[:, i], float(intercept[i]))
+            # Score with the (memory-mapped) rows, without a copy.
+            ner._scorer = LinearScorer(coef, intercept)
+
+        if meta.get('transitions'):
+            ner._transitions = tuple(arrays['transitions.' + name]
+                                     for name in ('trans', 'start', 'end'))
+        ner._trans_weight = meta.get('trans_weight', TRANS_WEIGHT)
+
+        if meta['viterbi']:
+            viterbi = Viterbi(len(labels))
+            tables = {name: arrays['viterbi.' + name]
+                      for name in ('trans', 'start', 'end', 'emit')}
+            observations = artifact.unpack_strings(
+                    arrays['viterbi.observations'])
+            viterbi.load_tables(tables, observations)
+            ner._viterbi = viterbi
+        return ner
 
 if __name__ == '__main__':
     ner = NER(1000)
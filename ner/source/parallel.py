@@ -0,0 +1,195 @@
+# !/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Python release: 3.9 or newer, the package uses multiprocessing.shared_memory
+#                 (3.8) and tracemalloc.reset_peak (3.9).
+
+"""
+Process pool helpers for the NER system.
+
+The process pool, shared memory and scipy modules are imported
+by the functions using them, the serial path never needs them.
+"""
+
+import os
+
+import numpy as np
+
+from sentence import Sentence
+import sentence
+
+# The shared objects attached in each worker.
+_shared = dict()
+
+
+def resolve_jobs(n_jobs):
+    """Turn the n_jobs option into a number of processes.
+
+    Args:
+        n_jobs: int - The number of processes, -1 means all the cores.
+
+    Returns:
+        int
+    """
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return n_jobs
+
+
+class SharedArrays:
+    """A group of numpy arrays placed in shared memory.
+
+    The workers attach the same memory blocks, so the arrays
+    are never pickled or copied.
+    """
+    def __init__(self, arrays):
+        """Copy the arrays into shared memory.
+
+        Args:
+            arrays: dict(str, numpy.ndarray)
+        """
+        from multiprocessing import shared_memory
+        self._blocks = []
+        self.spec = dict()
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            block = shared_memory.SharedMemory(create=True,
+                                               size=max(arr.nbytes, 1))
+            view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)
+            view[...] = arr
+            self._blocks.append(block)
+            self.spec[name] = (block.name, arr.shape, arr.dtype.str)
+
+    def close(self):
+        """Release the shared memory blocks.
+        """
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def attach(spec):
+    """Attach the arrays of a SharedArrays.spec.
+
+    Args:
+        spec: dict - The SharedArrays.spec.
+
+    Returns:
+        blocks: list(SharedMemory) - Must be kept alive with the arrays.
+        arrays: dict(str, numpy.ndarray)
+    """
+    from multiprocessing import shared_memory
+    blocks = []
+    arrays = dict()
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype),
+                                  buffer=block.buf)
+    return blocks, arrays
+
+
+def _init_train_worker(spec, shape):
+    from scipy.sparse import csr_matrix
+    blocks, arrays = attach(spec)
+    _shared['blocks'] = blocks
+    _shared['feats'] = csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']),
+            shape=shape, copy=False)
+    _shared['labels'] = arrays['labels']
+
+
+def _train_one(label_id, learner):
+    y = (_shared['labels'] == label_id).astype(np.int64)
+    learner.train(_shared['feats'], y)
+    return learner
+
+
+def train_learners(learners, feats, labels, n_jobs):
+    """Train one binary learner per label at the same time.
+
+    The feature matrix and the labels are shared with
+    the worker processes through shared memory.
+
+    Args:
+        learners: list(Learner) - The i-th learner is trained
+                                  for the label id i.
+        feats: scipy.sparse.csr_matrix - The features matrix.
+        labels: numpy.ndarray - The label id of each row.
+        n_jobs: int - The number of processes.
+
+    Returns:
+        list(Learner) - The trained learners.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    n_jobs = min(resolve_jobs(n_jobs), len(learners))
+    arrays = {
+            'data': feats.data,
+            'indices': feats.indices,
+            'indptr': feats.indptr,
+            'labels': labels,
+            }
+    with SharedArrays(arrays) as shared:
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 initializer=_init_train_worker,
+                                 initargs=(shared.spec, feats.shape)) as pool:
+            futures = [pool.submit(_train_one, i, learner)
+                       for i, learner in enumerate(learners)]
+            return [future.result() for future in futures]
+
+
+def _init_feature_worker(nerdic):
+    _shared['nerdic'] = nerdic
+
+
+def _featurize_chunk(items, ftype):
+    nerdic = _shared['nerdic']
+    sentences = [Sentence(labels, words, poss, nerdic)
+                 for words, poss, labels in items]
+    return sentence.featurize(sentences, ftype)
+
+
+def featurize(chunks, nerdic, ftype, n_jobs):
+    """Extract the features of the sentence chunks in a process pool.
+
+    Each worker holds its own read-only copy of the dictionary.
+
+    Args:
+        chunks: iterable(list((words, poss, labels))) - The sentences.
+        nerdic: NERDic
+        ftype: str - Indicating the feature type.
+        n_jobs: int - The number of processes.
+
+    Returns:
+        labels: numpy.ndarray - The label id of each token.
+        lengths: numpy.ndarray - The number of features of each token.
+        indices: numpy.ndarray - The feature ids of all the tokens,
+                                 in the original order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    labels = []
+    lengths = []
+    indices = []
+    with ProcessPoolExecutor(max_workers=resolve_jobs(n_jobs),
+                             initializer=_init_feature_worker,
+                             initargs=(nerdic,)) as pool:
+        futures = [pool.submit(_featurize_chunk, items, ftype)
+                   for items in chunks]
+        for future in futures:
+            label, length, index = future.result()
+            labels.append(label)
+            lengths.append(length)
+            indices.append(index)
+    if len(labels) == 0:
+        return sentence.featurize([], ftype)
+    return (np.concatenate(labels), np.concatenate(lengths),
+            np.concatenate(indices))
@@ -0,0 +1,315 @@
+# !/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Python release: 3.9 or newer, the package uses multiprocessing.shared_memory
+#                 (3.8) and tracemalloc.reset_peak (3.9).
+
+"""
+Stage level profiling of the NER system.
+
+The profiler is off by default. It is turned on by NER(profile=True)
+or by the NER_PROFILE environment variable, whose value is the
+directory of the reports:
+
+    NER_PROFILE=/tmp/ner-profile python3 ner.py
+
+Each profiled run (NER.train, NER.predict, NER.viterbi, ...) writes
+a json report with the wall time, the cpu time and the number of calls
+of each stage, plus the sizes of the large structures.
+
+cProfile and tracemalloc slow the stages down several times, so they
+are only used when asked for, by NER(profile_details=[...]) or by the
+NER_PROFILE_DETAILS environment variable:
+
+    NER_PROFILE=/tmp/ner-profile NER_PROFILE_DETAILS=cprofile,memory \
+        python3 ner.py
+
+cprofile: a cProfile dump of the whole run.
+memory: the peak traced memory of each stage.
+
+The times of such a run include the overhead, use a run without
+details for the real wall and cpu times.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+ENV = 'NER_PROFILE'
+DETAILS_ENV = 'NER_PROFILE_DETAILS'
+DETAILS = ['cprofile', 'memory']
+
+
+class _NullStage:
+    """The stage of a disabled profiler, it does nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    """Record the cost of the stages of a run.
+    """
+    def __init__(self, enabled=None, directory=None, details=None):
+        """Construct a new profiler.
+
+        Args:
+            enabled: bool - None means enabled if NER_PROFILE is set.
+            directory: str - The directory of the reports, None means
+                             the value of NER_PROFILE or the current one.
+            details: list(str) - Some of DETAILS, None means the
+                                 comma separated NER_PROFILE_DETAILS.
+        """
+        env = os.environ.get(ENV)
+        if enabled is None:
+            enabled = bool(env)
+        if directory is None:
+            directory = env or '.'
+        if details is None:
+            details = [detail for detail
+                       in os.environ.get(DETAILS_ENV, '').split(',')
+                       if detail.strip() != '']
+        details = [detail.strip() for detail in details]
+        for detail in details:
+            if detail not in DETAILS:
+                raise Exception('Unknown profile detail: {a} !'.format(
+                    a=detail))
+        self._enabled = enabled
+        self._directory = directory
+        self._cprofile_enabled = 'cprofile' in details
+        self._memory = 'memory' in details
+        self._run = None
+        self._stack = []
+        self._stages = dict()
+        self._sizes = dict()
+        self._cprofile = None
+        # The path of the last report.
+        self.report_path = None
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    ########################################################
+    # Public methods
+    ########################################################
+    def stage(self, name):
+        """Time a stage of the current run.
+
+        The calls of the same stage are summed up, the
+        stages can be nested.
+
+        Args:
+            name: str
+
+        Returns:
+            A context manager.
+        """
+        if not self._enabled or self._run is None:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def iterate(self, name, iterable):
+        """Time each step of an iterable as a stage.
+
+        Args:
+            name: str
+            iterable: iterable
+
+        Yields:
+            The items of the iterable.
+        """
+        if not self._enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def size(self, name, value):
+        """Record the size of a structure in the current run.
+
+        Args:
+            name: str
+            value: int or float
+        """
+        if self._enabled and self._run is not None:
+            self._sizes[name] = value
+
+    def run(self, name):
+        """Profile a whole run and write its report at the end.
+
+        A run inside another run is recorded as a stage of it.
+
+        Args:
+            name: str
+
+        Returns:
+            A context manager.
+        """
+        if not self._enabled:
+            return _NULL_STAGE
+        if self._run is not None:
+            return _Stage(self, name)
+        return _Run(self, name)
+
+    def report(self):
+        """The report of the current or the last run.
+
+        Returns:
+            dict
+        """
+        stages = dict()
+        for name, record in self._stages.items():
+            stages[name] = {
+                    'calls': record['calls'],
+                    'wall_sec': record['wall'],
+                    'cpu_sec': record['cpu'],
+                    }
+            if self._memory:
+                stages[name]['peak_mb'] = record['peak'] / (1 << 20)
+        return {'run': self._run, 'stages': stages, 'sizes': self._sizes}
+
+    ########################################################
+    # Private methods
+    ########################################################
+    def _begin_run(self, name):
+        self._run = name
+        self._stack = []
+        self._stages = dict()
+        self._sizes = dict()
+        self._started = time.strftime('%Y%m%d-%H%M%S')
+        self._tracing = self._memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        if self._cprofile_enabled:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def _end_run(self):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._tracing:
+            tracemalloc.stop()
+
+        os.makedirs(self._directory, exist_ok=True)
+        path = os.path.join(self._directory, '{a}-{b}-{c}'.format(
+            a=self._run, b=self._started, c=os.getpid()))
+        report = self.report()
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(path + '.prof')
+            self._cprofile = None
+            report['cprofile'] = path + '.prof'
+        with open(path + '.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        self.report_path = path + '.json'
+        self._run = None
+
+    def _enter(self):
+        """Start a (nested) stage.
+
+        Returns:
+            dict - The state of the stage.
+        """
+        current = 0
+        if self._memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak so far belongs to the open stages.
+            for state in self._stack:
+                state['peak'] = max(state['peak'], peak)
+            tracemalloc.reset_peak()
+        state = {
+                'wall': time.perf_counter(),
+                'cpu': time.process_time(),
+                'base': current,
+                'peak': current,
+                }
+        self._stack.append(state)
+        return state
+
+    def _exit(self, name, state):
+        """Stop a stage and add its cost to the record of its name.
+        """
+        self._stack.pop()
+        peak = state['peak']
+        if self._memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        if len(self._stack) != 0:
+            parent = self._stack[-1]
+            parent['peak'] = max(parent['peak'], peak)
+        cost = {
+                'calls': 1,
+                'wall': time.perf_counter() - state['wall'],
+                'cpu': time.process_time() - state['cpu'],
+                'peak': peak - state['base'],
+                }
+        record = self._stages.get(name)
+        if record is None:
+            self._stages[name] = dict(cost)
+        else:
+            record['calls'] += 1
+            record['wall'] += cost['wall']
+            record['cpu'] += cost['cpu']
+            record['peak'] = max(record['peak'], cost['peak'])
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._state = None
+
+    def __enter__(self):
+        self._state = self._profiler._enter()
+        return self
+
+    def __exit__(self, *args):
+        self._profiler._exit(self._name, self._state)
+        return False
+
+
+class _Run:
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._state = None
+
+    def __enter__(self):
+        self._profiler._begin_run(self._name)
+        self._state = self._profiler._enter()
+        return self
+
+    def __exit__(self, *args):
+        self._profiler._exit('total', self._state)
+        self._profiler._end_run()
+        return False
+
+
+def profiled(name):
+    """Decorate a method of an object with a _profiler
+    attribute, so each call is a profiled run.
+
+    Args:
+        name: str - The name of the run.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self._profiler.run(name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
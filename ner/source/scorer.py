@@ -0,0 +1,200 @@
+# !/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Python release: 3.9 or newer, the package uses multiprocessing.shared_memory
+#                 (3.8) and tracemalloc.reset_peak (3.9).
+
+"""
+Linear scoring of the tokens with all the learners at once.
+"""
+
+import numpy as np
+
+# The storage types of the compressed weights.
+DTYPES = ['float64', 'float32', 'float16', 'int8']
+
+
+class LinearScorer:
+    """Score the tokens with one (n_features x labels) weight matrix.
+
+    All the features are binary indicators, so the confidences of a
+    token are the sum of the weight rows of its feature ids plus the
+    bias. The rows are gathered block by block into a reused buffer,
+    so neither a float CSR matrix nor a call per learner is needed.
+    A scorer reuses its buffers and must not be shared by threads.
+
+    A compressed scorer only keeps the rows of the features with a
+    non-zero weight, row_map maps a feature id to its row, the pruned
+    features share a last row of zeros. The int8 weights are scaled
+    back to floats by a scale for each label.
+    """
+    def __init__(self, weights, bias, block_size=1 << 12, row_map=None,
+                 scale=None):
+        """Construct a new scorer.
+
+        Args:
+            weights: numpy.ndarray - (rows x labels), one row for each
+                                     feature, may be memory-mapped.
+            bias: numpy.ndarray - The intercept of each label.
+            block_size: int - The number of weight rows gathered at once,
+                              small enough for the buffer to stay in cache.
+            row_map: numpy.ndarray - The row of each feature id,
+                                     None means the feature id itself.
+            scale: numpy.ndarray - The scale of each label of the
+                                   int8 weights.
+        """
+        # Plain views, the numpy.memmap subclass slows down np.take.
+        self._weights = np.asarray(weights)
+        self._row_map = None if row_map is None else np.asarray(row_map)
+        self._scale = None if scale is None else np.asarray(scale)
+        # The confidences are computed in float32 at least.
+        self._dtype = np.result_type(self._weights.dtype, np.float32)
+        if self._weights.dtype == np.int8:
+            # Sum the int8 weights as integers, they never overflow.
+            self._sum_dtype = np.dtype(np.int32)
+        else:
+            self._sum_dtype = self._dtype
+        self._bias = np.asarray(bias, dtype=self._dtype)
+        self._block_size = block_size
+        self._buffers = dict()
+
+    @classmethod
+    def from_learners(cls, learners):
+        """Stack the weights of the binary learners.
+
+        Args:
+            learners: list(Learner) - The i-th learner is the label id i.
+
+        Returns:
+            LinearScorer
+        """
+        weights = np.column_stack([learner.coef for learner in learners])
+        bias = [learner.intercept for learner in learners]
+        return cls(weights, bias)
+
+    def compress(self, threshold=0.0, dtype='float64'):
+        """Prune the small weights and quantize the others.
+
+        Args:
+            threshold: float - The weights whose absolute values are
+                               smaller than it are set to zero.
+            dtype: str - One of DTYPES. The int8 weights are
+                         w / scale rounded, scale = max(|w|) / 127
+                         for each label.
+
+        Returns:
+            LinearScorer - The compressed scorer.
+        """
+        if dtype not in DTYPES:
+            raise Exception('Unknown dtype: {a} !'.format(a=dtype))
+        if self._row_map is not None or self._scale is not None:
+            raise Exception('The scorer is compressed already !')
+        weights = np.array(self._weights, dtype=np.float64)
+        weights[np.abs(weights) < threshold] = 0
+        keep = np.flatnonzero(np.any(weights != 0, axis=1))
+        row_map = np.full(len(weights), len(keep), dtype=np.int32)
+        row_map[keep] = np.arange(len(keep), dtype=np.int32)
+        rows = np.zeros((len(keep) + 1, weights.shape[1]), dtype=np.float64)
+        rows[:len(keep)] = weights[keep]
+
+        scale = None
+        if dtype == 'int8':
+            scale = np.abs(rows).max(axis=0) / 127
+            scale[scale == 0] = 1.0
+            rows = np.round(rows / scale)
+        rows = rows.astype(dtype)
+        return LinearScorer(rows, self._bias, self._block_size,
+                            row_map, scale)
+
+    def arrays(self):
+        """Return the arrays of the scorer to be saved.
+
+        Returns:
+            dict(str, numpy.ndarray)
+        """
+        reval = {'weights': self._weights, 'bias': self._bias}
+        if self._row_map is not None:
+            reval['row_map'] = self._row_map
+        if self._scale is not None:
+            reval['scale'] = self._scale
+        return reval
+
+    ########################################################
+    # Public methods
+    ########################################################
+    def score(self, lengths, indices):
+        """Compute the confidences of the tokens.
+
+        Args:
+            lengths: numpy.ndarray - The number of features of each token,
+                                     every token has at least one.
+            indices: numpy.ndarray - The feature ids of all the tokens.
+
+        Returns:
+            numpy.ndarray - (tokens x labels) confidences, a view of a
+                            buffer overwritten by the next call.
+        """
+        n = len(lengths)
+        weights = self._weights
+        total = self._buffer('total', n, self._sum_dtype)
+        if n == 0:
+            return self._buffer('confidence', n, self._dtype)
+        if self._row_map is not None:
+            indices = self._row_map[indices]
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        token = 0
+        while token < n:
+            # The tokens whose features fit in one block.
+            stop = np.searchsorted(ends, starts[token] + self._block_size,
+                                   side='right')
+            stop = max(stop, token + 1)
+            low = starts[token]
+            high = ends[stop-1]
+            gather = self._buffer('gather', high - low, weights.dtype)
+            np.take(weights, indices[low:high], axis=0, out=gather)
+            np.add.reduceat(gather, starts[token:stop] - low, axis=0,
+                            dtype=self._sum_dtype, out=total[token:stop])
+            token = stop
+        if self._scale is None:
+            confidence = total
+        else:
+            confidence = self._buffer('confidence', n, self._dtype)
+            np.multiply(total, self._scale, out=confidence)
+        confidence += self._bias
+        return confidence
+
+    ########################################################
+    # Property
+    ########################################################
+    @property
+    def weights(self):
+        return self._weights
+
+    @property
+    def bias(self):
+        return self._bias
+
+    @property
+    def compressed(self):
+        return self._row_map is not None or self._scale is not None
+
+    @property
+    def nbytes(self):
+        """The size of the arrays of the scorer.
+        """
+        return sum(arr.nbytes for arr in self.arrays().values())
+
+    ########################################################
+    # Private methods
+    ########################################################
+    def _buffer(self, name, rows, dtype):
+        """Return the first rows of a (rows x labels) buffer,
+        which grows by doubling.
+        """
+        buf = self._buffers.get(name)
+        if buf is None or len(buf) < rows:
+            size = rows if buf is None else max(rows, 2 * len(buf))
+            buf = np.empty((size, self._weights.shape[1]), dtype=dtype)
+            self._buffers[name] = buf
+        return buf[:rows]
@@ -14,6 +14,10 @@ Sentence structure for the NER project.
 """
 
 import collections
+import sys
+import zlib
+
+import numpy as np
 
 
 POSITIONS = ['curr-', 'prev-', 'next-', 'prev2-', 'next2-']
@@ -22,6 +26,24 @@ POS = ['PHIPOS', 'OMEGAPOS', 'UNKPOS']
 OTHERS = ['$init-caps$', '$all-caps$', '$contains-dig$',
           '$all-dig$', '$punc-mark$', '$contains-dots$',
           '$contains-hypen$', '$single-char$']
+
+# The version of the feature templates,
+# should be increased whenever the feature ids change.
+FEATURE_VERSION = 1
+
+# Indexes into POSITIONS.
+CURR, PREV, NEXT, PREV2, NEXT2 = range(len(POSITIONS))
+# Indexes into WORDS and POS.
+PHI, OMEGA, UNKWORD = range(len(WORDS))
+UNKPOS = UNKWORD
+# Indexes into OTHERS.
+(INIT_CAPS, ALL_CAPS, CONTAINS_DIG, ALL_DIG, PUNC_MARK,
+ CONTAINS_DOTS, CONTAINS_HYPEN, SINGLE_CHAR) = range(len(OTHERS))
+
+# Hash seed of the poss, so that a pos never collides with
+# the same string used as a word.
+_POS_SEED = 0x5f3759df
+
 LABELS = {
         'O': 0,
         'B-PER': 1,
@@ -49,7 +71,20 @@ REVERSE_LABELS = {
 
 class Sentence:
     """The class for sentence.
+
+    The words and poss are encoded into integer arrays once, all
+    the context features are generated by shifting these arrays.
     """
+    # The feature templates of each ftype.
+    _maps = {
+            'word': (),
+            'poscon': ('others', 'poscon'),
+            'lexcon': ('others', 'lexcon'),
+            'bothcon': ('others', 'poscon', 'lexcon'),
+            }
+    # The number of columns of each feature template.
+    _widths = {'others': len(OTHERS), 'poscon': 4, 'lexcon': 4}
+
     def __init__(self, labels, words, poss, nerdic):
         if len(words) != len(poss) or len(labels) != len(words):
             raise Exception('Words and poss are not matched !')
@@ -58,12 +93,8 @@ class Sentence:
         self._poss = poss
         self._nerdic = nerdic
         self._predict = None
-        self._maps = {
-                'word': self._word,
-                'poscon': self._poscon,
-                'lexcon': self._lexcon,
-                'bothcon': self._bothcon,
-                }
+        self._word_ids = None
+        self._pos_ids = None
 
     ########################################################
     # Public methods
@@ -72,8 +103,8 @@ class Sentence:
         """Generate the feature keys based on the ftype.
         """
         reval = []
-        for i in range(len(self._words)):
-            reval.append(self._maps[ftype](i))
+        for ids in self.generate_ids(ftype):
+            reval.append([self._nerdic.key(v) for v in ids])
 
         return reval
 
@@ -81,15 +112,84 @@ class Sentence:
         """Generate the feature indexs based on the ftype.
         """
         reval = []
-        feat_keys = self.generate_keys(ftype)
-
-        for label, vector in zip(self._labels, feat_keys):
-            tmp = [self._nerdic[key] for key in vector]
-            tmp = sorted(tmp)
+        for label, tmp in zip(self._labels, self.generate_ids(ftype)):
             reval.append((LABELS[label], tmp))
 
         return reval
 
+    def generate_ids(self, ftype):
+        """Generate the sorted feature ids of each token.
+
+        Returns:
+            list(list(int))
+        """
+        lengths, indices = self.feature_arrays(ftype)
+        bounds = np.cumsum(lengths)[:-1]
+        return [ids.tolist() for ids in np.split(indices, bounds)]
+
+    @classmethod
+    def feature_width(cls, ftype):
+        """Return the number of feature columns of a token.
+
+        Args:
+            ftype: str - Indicating the feature type.
+
+        Returns:
+            int
+        """
+        if ftype not in cls._maps:
+            raise Exception('Unknown ftype: {a} !'.format(a=ftype))
+        return 1 + sum(cls._widths[template] for template in cls._maps[ftype])
+
+    def feature_arrays(self, ftype, out=None):
+        """Generate the feature ids of all the tokens based on the ftype.
+
+        Each feature template is one column of a (tokens x templates)
+        table, the missing features are filled with -1.
+
+        Args:
+            ftype: str - Indicating the feature type.
+            out: numpy.ndarray - A flat int64 buffer of at least
+                                 len(self) * feature_width(ftype) items
+                                 used for the table, None means a new one.
+
+        Returns:
+            lengths: numpy.ndarray - The number of features of each token.
+            indices: numpy.ndarray - The sorted feature ids of each token,
+                                     concatenated.
+        """
+        n = len(self)
+        width = self.feature_width(ftype)
+        if out is None:
+            table = np.empty((n, width), dtype=np.int64)
+        else:
+            table = out[:n*width].reshape(n, width)
+        nerdic = self._nerdic
+        word_ids = self._encode_words()
+
+        table[:, 0] = nerdic.word_features(word_ids, CURR)
+        column = 1
+        for template in self._maps[ftype]:
+            block = table[:, column:column+self._widths[template]]
+            if template == 'others':
+                block[:] = self._others()
+            elif template == 'poscon':
+                self._context(self._encode_poss(), nerdic.pos_features,
+                              nerdic.pos_constant, block)
+            elif template == 'lexcon':
+                self._context(word_ids, nerdic.word_features,
+                              nerdic.word_constant, block)
+            column += self._widths[template]
+        table.sort(axis=1)
+        if ftype == 'bothcon':
+            # The current word and the others are in both of
+            # poscon and lexcon, keep the features unique.
+            rest = table[:, 1:]
+            rest[rest == table[:, :-1]] = -1
+
+        valid = table >= 0
+        return valid.sum(axis=1), table[valid]
+
     def add_predict(self, label_ids):
         """Add the predict label for the current sentences.
         """
@@ -103,6 +203,16 @@ class Sentence:
         reval = [LABELS[i] for i in self._labels]
         return reval
 
+    @property
+    def tags(self):
+        return self._labels[:]
+
+    @property
+    def predict_tags(self):
+        if self._predict is None:
+            return None
+        return self._predict[:]
+
     @property
     def poss(self):
         return self._poss[:]
@@ -141,170 +251,456 @@ class Sentence:
     ########################################################
     # Private methods
     ########################################################
-    def _word(self, index):
-        """Generate the key for ftype word.
+    def _encode_words(self):
+        if self._word_ids is None:
+            self._word_ids = self._nerdic.encode_words(self._words)
+        return self._word_ids
 
-        Args:
-            index: int - The index of the word
+    def _encode_poss(self):
+        if self._pos_ids is None:
+            self._pos_ids = self._nerdic.encode_poss(self._poss)
+        return self._pos_ids
+
+    def _others(self):
+        """Generate the orthographic feature columns.
 
         Returns:
-            list(str): The feature keys for the words
-        """
-        if index < -1 or index >= len(self._words):
-            raise Exception('Invalid index !')
-        if index >= 0 and index < len(self._words):
-            key = 'curr-' + self._words[index] + '-word'
-            if key not in self._nerdic:
-                key = 'curr-UNKWORD'
-        return [key]
-
-    # def _wordcap(self, index):
-    #     key = self._word(index)
-    #     word = self._words[index]
-    #     if word[0].isupper() is True:
-    #         key.append(CAP)
-    #     return key
-
-    def _others(self, index):
-        key = self._word(index)
-        word = self._words[index]
-        # Inital caps
-        if word[0].isupper() is True:
-            key.append('$init-caps$')
-        # All caps
-        if word.isupper() is True:
-            key.append('$all-caps$')
-        # Contains digitals
-        val = [w.isdigit() for w in word]
-        if bool(sum(val)) is True:
-            key.append('$contains-dig$')
-        # all digital
-        if word.isdigit() is True:
-            key.append('$all-dig$')
-        # punc makrs
-        marks = [',', '?', '!', '@', '#', '$', '%', '^',
-                 '&', '*', '(', ')', '[', ']']
-        for m in marks:
-            if m in word:
-                key.append('$punc-mark$')
-                break
-        # contains dots
-        if '.' in word:
-            key.append('$contains-dots$')
-        # hypen
-        if '-' in word:
-            key.append('$contains-hypen$')
-        if len(word) == 1:
-            key.append('$single-char$')
-        return key
-
-    def _poscon(self, index):
-        key = self._others(index)
-
-        if index - 1 <= -1:
-            t = 'prev-PHIPOS'
-        else:
-            t = 'prev-' + self._poss[index-1] + '-pos'
-            if t not in self._nerdic:
-                t = 'prev-UNKPOS'
-        key.append(t)
+            numpy.ndarray - (tokens x OTHERS) feature ids.
+        """
+        masks = self._nerdic.orthographic(self._words)
+        flags = (masks[:, None] >> np.arange(len(OTHERS))) & 1
+        return np.where(flags, self._nerdic.other_features(), -1)
 
-        if index - 2 <= -1:
-            t = 'prev2-PHIPOS'
-        else:
-            t = 'prev2-' + self._poss[index-2] + '-pos'
-            if t not in self._nerdic:
-                t = 'prev2-UNKPOS'
-        key.append(t)
+    def _context(self, ids, features, constant, block=None):
+        """Generate the context feature columns by shifting the ids.
 
-        if index + 1 == len(self._words):
-            t = 'next-OMEGAPOS'
-        else:
-            t = 'next-' + self._poss[index+1] + '-pos'
-            if t not in self._nerdic:
-                t = 'next-UNKPOS'
-        key.append(t)
+        The features of the four positions are computed in one call,
+        then each column is shifted by its offset.
 
-        if index + 2 >= len(self._words):
-            t = 'next2-OMEGAPOS'
-        else:
-            t = 'next2-' + self._poss[index+2] + '-pos'
-            if t not in self._nerdic:
-                t = 'next2-UNKPOS'
-        key.append(t)
-        return key
+        Args:
+            ids: numpy.ndarray - The encoded words or poss.
+            features: function - NERDic.word_features/NERDic.pos_features
+            constant: function - NERDic.word_constant/NERDic.pos_constant
+            block: numpy.ndarray - The (tokens x 4) columns to fill,
+                                   None means a new array.
 
-    def _lexcon(self, index):
-        key = self._others(index)
+        Returns:
+            numpy.ndarray: (tokens x 4) columns of prev, prev2,
+                           next and next2.
+        """
+        n = len(ids)
+        shifts = ((PREV, 1), (PREV2, 2), (NEXT, -1), (NEXT2, -2))
+        positions = np.array([position for position, _ in shifts])
+        feats = features(ids[:, None], positions)
+        if block is None:
+            block = np.empty((n, len(shifts)), dtype=np.int64)
+        for i, (position, offset) in enumerate(shifts):
+            if offset > 0:
+                block[:offset, i] = constant(position, PHI)
+                block[offset:, i] = feats[:max(n-offset, 0), i]
+            else:
+                block[:max(n+offset, 0), i] = feats[-offset:, i]
+                block[max(n+offset, 0):, i] = constant(position, OMEGA)
+        return block
+
+
+def featurize(sentences, ftype):
+    """Extract the features of the sentences.
+
+    Args:
+        sentences: list(Sentence)
+        ftype: str - Indicating the feature type.
+
+    Returns:
+        labels: numpy.ndarray - The label id of each token.
+        lengths: numpy.ndarray - The number of features of each token.
+        indices: numpy.ndarray - The feature ids of all the tokens.
+    """
+    labels = []
+    lengths = []
+    indices = []
+    for sent in sentences:
+        length, index = sent.feature_arrays(ftype)
+        labels.extend(sent.labels)
+        lengths.append(length)
+        indices.append(index)
+    if len(labels) == 0:
+        return (np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int32),
+                np.zeros(0, dtype=np.int32))
+    return (np.array(labels, dtype=np.int8),
+            np.concatenate(lengths).astype(np.int32),
+            np.concatenate(indices).astype(np.int32))
+
+
+def orthographic(word):
+    """Compute the orthographic features of a word.
+
+    Args:
+        word: str
+
+    Returns:
+        int - A bitmask, the bit i is set if the word has OTHERS[i].
+    """
+    mask = 0
+    # Inital caps
+    if word[0].isupper() is True:
+        mask |= 1 << INIT_CAPS
+    # All caps
+    if word.isupper() is True:
+        mask |= 1 << ALL_CAPS
+    # Contains digitals
+    val = [w.isdigit() for w in word]
+    if bool(sum(val)) is True:
+        mask |= 1 << CONTAINS_DIG
+    # all digital
+    if word.isdigit() is True:
+        mask |= 1 << ALL_DIG
+    # punc makrs
+    marks = [',', '?', '!', '@', '#', '$', '%', '^',
+             '&', '*', '(', ')', '[', ']']
+    for m in marks:
+        if m in word:
+            mask |= 1 << PUNC_MARK
+            break
+    # contains dots
+    if '.' in word:
+        mask |= 1 << CONTAINS_DOTS
+    # hypen
+    if '-' in word:
+        mask |= 1 << CONTAINS_HYPEN
+    if len(word) == 1:
+        mask |= 1 << SINGLE_CHAR
+    return mask
+
+
+class OrthographicCache:
+    """Cache the orthographic bitmask of each word type.
+
+    The word types repeat heavily, so each distinct word only
+    needs to be analysed once. With max_size, the least recently
+    used words are dropped, which bounds the memory for streaming.
+    """
+    def __init__(self, max_size=None):
+        """Construct a new cache.
 
-        if index - 1 == -1:
-            t = 'prev-PHI'
+        Args:
+            max_size: int - The maximum number of words, None means
+                            no limit.
+        """
+        self._max_size = max_size
+        if max_size is None:
+            self._masks = dict()
         else:
-            t = 'prev-' + self._words[index-1] + '-word'
-            if t not in self._nerdic:
-                t = 'prev-UNKWORD'
-        key.append(t)
+            self._masks = collections.OrderedDict()
 
-        if index - 2 <= -1:
-            t = 'prev2-PHI'
-        else:
-            t = 'prev2-' + self._words[index-2] + '-word'
-            if t not in self._nerdic:
-                t = 'prev2-UNKWORD'
-        key.append(t)
+    def masks(self, words):
+        """Return the orthographic bitmasks of the words.
 
-        if index + 1 == len(self._words):
-            t = 'next-OMEGA'
-        else:
-            t = 'next-' + self._words[index+1] + '-word'
-            if t not in self._nerdic:
-                t = 'next-UNKWORD'
-        key.append(t)
+        Args:
+            words: list(str)
 
-        if index + 2 >= len(self._words):
-            t = 'next2-OMEGA'
-        else:
-            t = 'next2-' + self._words[index+2] + '-word'
-            if t not in self._nerdic:
-                t = 'next2-UNKWORD'
-        key.append(t)
-        return key
+        Returns:
+            numpy.ndarray
+        """
+        return np.array([self[word] for word in words], dtype=np.int64)
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def __getitem__(self, word):
+        masks = self._masks
+        mask = masks.get(word)
+        if mask is None:
+            mask = orthographic(word)
+            masks[word] = mask
+            if self._max_size is not None and len(masks) > self._max_size:
+                masks.popitem(last=False)
+        elif self._max_size is not None:
+            masks.move_to_end(word)
+        return mask
+
+    def __len__(self):
+        return len(self._masks)
 
-    def _bothcon(self, index):
-        key1 = self._poscon(index)
-        key2 = self._lexcon(index)
 
-        key = set(key1) | set(key2)
-        return list(key)
+# The cache shared by all the dictionaries of the process.
+ORTHO_CACHE = OrthographicCache()
 
 
 class NERDic:
     """Dictionary class for NER task.
+
+    Only the distinct words and poss are stored, each one with
+    an integer id. The feature id of a (position, word) or a
+    (position, pos) pair is computed from the ids arithmetically,
+    in the layout of the string keys:
+
+        'x'
+        [5 positions of each word]   ('curr-' + word + '-word', ...)
+        [5 positions x WORDS]        ('curr-PHI', ...)
+        [5 positions of each pos]    ('curr-' + pos + '-pos', ...)
+        [5 positions x POS]          ('curr-PHIPOS', ...)
+        OTHERS
+
+    There are 2 different modes:
+
+    1.vocabulary: every distinct word and pos of the training set
+                  gets its own feature ids.
+    2.hashed: the feature keys are hashed into a fixed space of
+              2**hash_bits ids, no vocabulary is needed, so the
+              training set does not have to be read in advance.
     """
-    def __init__(self, train_path):
+    def __init__(self, train_path=None, hash_bits=None, vocab=None,
+                 ortho_cache=None):
         """Construct a new NER features.
 
         Args:
             train_path: str - The path of training set.
+            hash_bits: int - The width of the hashed feature space,
+                             None means the vocabulary mode.
+            vocab: (list(str), list(str)) - The words and poss in id
+                   order, used instead of reading the training set.
+            ortho_cache: OrthographicCache - None means ORTHO_CACHE.
         """
+        if train_path is None and hash_bits is None and vocab is None:
+            raise Exception('Either train_path or hash_bits is needed !')
         self._train_path = train_path
+        self._hash_bits = hash_bits
         self._word_num = -1
         self._pos_num = -1
-
-        word, pos = self._read_wordpos(train_path)
+        self._other_ids = None
+        self._ortho_cache = ortho_cache
+        if ortho_cache is None:
+            self._ortho_cache = ORTHO_CACHE
+
+        if hash_bits is not None:
+            self._word_ids = None
+            self._pos_ids = None
+            self._word_list = None
+            self._pos_list = None
+            self._max_id = 2 ** hash_bits - 1
+            return
+
+        if vocab is None:
+            word, pos = self._read_wordpos(train_path)
+        else:
+            word, pos = vocab
         self._word_num = len(word)
         self._pos_num = len(pos)
 
-        self._dic = self._generate_dicts(word, pos)
+        self._word_ids = self._generate_ids(word)
+        self._pos_ids = self._generate_ids(pos)
+        self._word_list = list(self._word_ids)
+        self._pos_list = list(self._pos_ids)
+
+        P = len(POSITIONS)
+        self._word_base = 1
+        self._word_const_base = self._word_base + P * self._word_num
+        self._pos_base = self._word_const_base + P * len(WORDS)
+        self._pos_const_base = self._pos_base + P * self._pos_num
+        self._others_base = self._pos_const_base + P * len(POS)
+        self._max_id = self._others_base + len(OTHERS) - 1
+
+    @classmethod
+    def from_vocab(cls, words, poss, ortho_cache=None):
+        """Construct the dictionary from the words and poss in id order.
 
-        # for key, value in self._dic.items():
-        #     s = ':'.join([key, str(value)])
-        #     print(s)
+        Args:
+            words: list(str)
+            poss: list(str)
+            ortho_cache: OrthographicCache - None means ORTHO_CACHE.
+        """
+        return cls(vocab=(words, poss), ortho_cache=ortho_cache)
 
     def max_id(self):
         """Reuturn the max id number.
         """
-        return max(self._dic.values())
+        return self._max_id
+
+    def key(self, feature_id):
+        """Return the string key of the feature id.
+
+        Args:
+            feature_id: int
+
+        Returns:
+            str
+        """
+        if self._word_ids is None:
+            raise Exception('The hashed dictionary has no keys !')
+        P = len(POSITIONS)
+        if feature_id == 0:
+            return 'x'
+        if feature_id < self._word_const_base:
+            index, p = divmod(feature_id - self._word_base, P)
+            return self._key(POSITIONS[p], self._word_list[index], '-word')
+        if feature_id < self._pos_base:
+            p, m = divmod(feature_id - self._word_const_base, len(WORDS))
+            return self._key(POSITIONS[p], WORDS[m], '')
+        if feature_id < self._pos_const_base:
+            index, p = divmod(feature_id - self._pos_base, P)
+            return self._key(POSITIONS[p], self._pos_list[index], '-pos')
+        if feature_id < self._others_base:
+            p, m = divmod(feature_id - self._pos_const_base, len(POS))
+            return self._key(POSITIONS[p], POS[m], '')
+        if feature_id <= self._max_id:
+            return OTHERS[feature_id - self._others_base]
+        raise KeyError(feature_id)
+
+    def word_feature(self, position, word):
+        """Return the feature id of the word at the given position.
+
+        Args:
+            position: int - The index in POSITIONS.
+            word: str
+
+        Returns:
+            int - The id of the unknown word if word is not seen.
+        """
+        if self._word_ids is None:
+            return self._hash_id(zlib.crc32(word.encode('utf-8')), position)
+        index = self._word_ids.get(word)
+        if index is None:
+            return self.word_constant(position, UNKWORD)
+        return self._word_base + index * len(POSITIONS) + position
+
+    def pos_feature(self, position, pos):
+        """Return the feature id of the pos at the given position.
+
+        Args:
+            position: int - The index in POSITIONS.
+            pos: str
+
+        Returns:
+            int - The id of the unknown pos if pos is not seen.
+        """
+        if self._pos_ids is None:
+            h = zlib.crc32(pos.encode('utf-8'), _POS_SEED)
+            return self._hash_id(h, position)
+        index = self._pos_ids.get(pos)
+        if index is None:
+            return self.pos_constant(position, UNKPOS)
+        return self._pos_base + index * len(POSITIONS) + position
+
+    def encode_words(self, words):
+        """Encode the words into integer ids.
+
+        Args:
+            words: list(str)
+
+        Returns:
+            numpy.ndarray - The unseen words are -1. In the hashed mode
+                            the ids are the hash values of the words.
+        """
+        if self._word_ids is None:
+            return np.array([zlib.crc32(w.encode('utf-8')) for w in words],
+                            dtype=np.int64)
+        get = self._word_ids.get
+        return np.array([get(w, -1) for w in words], dtype=np.int64)
+
+    def encode_poss(self, poss):
+        """Encode the poss into integer ids.
+
+        Args:
+            poss: list(str)
+
+        Returns:
+            numpy.ndarray - The unseen poss are -1. In the hashed mode
+                            the ids are the hash values of the poss.
+        """
+        if self._pos_ids is None:
+            return np.array([zlib.crc32(p.encode('utf-8'), _POS_SEED)
+                             for p in poss], dtype=np.int64)
+        get = self._pos_ids.get
+        return np.array([get(p, -1) for p in poss], dtype=np.int64)
+
+    def word_features(self, ids, position):
+        """The vectorized version of word_feature.
+
+        Args:
+            ids: numpy.ndarray - The ids from encode_words.
+            position: int - The index in POSITIONS.
+
+        Returns:
+            numpy.ndarray
+        """
+        P = len(POSITIONS)
+        if self._word_ids is None:
+            return 1 + (ids * P + position) % self._max_id
+        return np.where(ids >= 0, self._word_base + ids * P + position,
+                        self.word_constant(position, UNKWORD))
+
+    def pos_features(self, ids, position):
+        """The vectorized version of pos_feature.
+
+        Args:
+            ids: numpy.ndarray - The ids from encode_poss.
+            position: int - The index in POSITIONS.
+
+        Returns:
+            numpy.ndarray
+        """
+        P = len(POSITIONS)
+        if self._pos_ids is None:
+            return 1 + (ids * P + position) % self._max_id
+        return np.where(ids >= 0, self._pos_base + ids * P + position,
+                        self.pos_constant(position, UNKPOS))
+
+    def word_constant(self, position, constant):
+        """Return the feature id of PHI/OMEGA/UNKWORD at the position.
+
+        Args:
+            position: int - The index in POSITIONS.
+            constant: int - The index in WORDS.
+        """
+        if self._word_ids is None:
+            return self._hash(POSITIONS[position] + WORDS[constant])
+        return self._word_const_base + position * len(WORDS) + constant
+
+    def pos_constant(self, position, constant):
+        """Return the feature id of PHIPOS/OMEGAPOS/UNKPOS at the position.
+
+        Args:
+            position: int - The index in POSITIONS.
+            constant: int - The index in POS.
+        """
+        if self._pos_ids is None:
+            return self._hash(POSITIONS[position] + POS[constant])
+        return self._pos_const_base + position * len(POS) + constant
+
+    def other_feature(self, index):
+        """Return the feature id of the orthographic feature.
+
+        Args:
+            index: int - The index in OTHERS.
+        """
+        if self._word_ids is None:
+            return self._hash(OTHERS[index])
+        return self._others_base + index
+
+    def orthographic(self, words):
+        """Return the orthographic bitmasks of the words.
+
+        Args:
+            words: list(str)
+
+        Returns:
+            numpy.ndarray - The bit i is set if the word has OTHERS[i].
+        """
+        return self._ortho_cache.masks(words)
+
+    def other_features(self):
+        """Return the feature ids of all the orthographic features.
+
+        Returns:
+            numpy.ndarray - The i-th one is the id of OTHERS[i].
+        """
+        if self._other_ids is None:
+            self._other_ids = np.array(
+                    [self.other_feature(i) for i in range(len(OTHERS))],
+                    dtype=np.int64)
+        return self._other_ids
 
     ########################################################
     # Property
@@ -317,22 +713,109 @@ class NERDic:
     def distinct_pos_num(self):
         return self._pos_num
 
+    @property
+    def hashed(self):
+        return self._hash_bits is not None
+
+    @property
+    def hash_bits(self):
+        return self._hash_bits
+
+    @property
+    def words(self):
+        if self._word_list is None:
+            return None
+        return self._word_list[:]
+
+    @property
+    def poss(self):
+        if self._pos_list is None:
+            return None
+        return self._pos_list[:]
+
     ########################################################
     # Magic methods
     ########################################################
     def __getitem__(self, key):
-        return self._dic[key]
+        reval = self._lookup(key)
+        if reval is None:
+            raise KeyError(key)
+        return reval
 
     def __contains__(self, key):
-        return key in self._dic
+        return self._lookup(key) is not None
 
     def __iter__(self):
-        for key in self._dic:
+        if self._word_ids is None:
+            raise Exception('The hashed dictionary has no keys !')
+        yield 'x'
+        for w in self._word_ids:
+            for p in POSITIONS:
+                yield self._key(p, w, '-word')
+        for key in self._constant_word():
+            yield key
+        for pos in self._pos_ids:
+            for p in POSITIONS:
+                yield self._key(p, pos, '-pos')
+        for key in self._constant_pos():
+            yield key
+        for key in OTHERS:
             yield key
 
     ########################################################
     # Private methods
     ########################################################
+    def _lookup(self, key):
+        """Find the feature id of a string key.
+
+        Args:
+            key: str - The feature key.
+
+        Returns:
+            int - None if the key is not in the dictionary.
+        """
+        if key == 'x':
+            return 0
+        if key in OTHERS:
+            return self.other_feature(OTHERS.index(key))
+        for position, p in enumerate(POSITIONS):
+            if not key.startswith(p):
+                continue
+            string = key[len(p):]
+            if string.endswith('-word'):
+                word = string[:-len('-word')]
+                if self._word_ids is None or word in self._word_ids:
+                    return self.word_feature(position, word)
+            elif string.endswith('-pos'):
+                pos = string[:-len('-pos')]
+                if self._pos_ids is None or pos in self._pos_ids:
+                    return self.pos_feature(position, pos)
+            elif string in WORDS:
+                return self.word_constant(position, WORDS.index(string))
+            elif string in POS:
+                return self.pos_constant(position, POS.index(string))
+            return None
+        return None
+
+    def _hash(self, key):
+        """Map the key into the hashed feature space.
+
+        Args:
+            key: str - The feature key.
+        """
+        return self._hash_id(zlib.crc32(key.encode('utf-8')), 0)
+
+    def _hash_id(self, h, position):
+        """Combine a hash value and a position into a feature id.
+
+        The id 0 is kept unused, the same as the vocabulary mode.
+
+        Args:
+            h: int - The hash value.
+            position: int - The index in POSITIONS.
+        """
+        return 1 + (h * len(POSITIONS) + position) % self._max_id
+
     def _read_wordpos(self, path):
         """Read all the distinct words and pos.
 
@@ -393,38 +876,16 @@ class NERDic:
                 keys.append(key)
         return keys
 
-    def _generate_dicts(self, words, poss):
-        """Generate the dictionary from words and poss.
+    def _generate_ids(self, strings):
+        """Give each distinct string an id.
+
         Args:
-            words: set - A set of distinct words.
-            poss: set - A set of distinct poss.
+            strings: {set, list} - The distinct words or poss.
 
         Return:
-            a dictionary.
+            dict(str, int)
         """
-        dic = collections.OrderedDict()
-
-        # The index should starts from 1
-        dic['x'] = len(dic)
-        for w in words:
-            for p in POSITIONS:
-                # Current word
-                key = self._key(p, w, '-word')
-                dic[key] = len(dic)
-        # Constant
-        keys = self._constant_word()
-        for key in keys:
-            dic[key] = len(dic)
-
-        for p in poss:
-            for pp in POSITIONS:
-                # Current pos
-                key = self._key(pp, p, '-pos')
-                dic[key] = len(dic)
-        keys = self._constant_pos()
-        for key in keys:
-            dic[key] = len(dic)
-
-        for key in OTHERS:
-            dic[key] = len(dic)
+        dic = dict()
+        for string in strings:
+            dic[sys.intern(string)] = len(dic)
         return dic
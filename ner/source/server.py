@@ -0,0 +1,352 @@
+# !/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Python release: 3.9 or newer, the package uses multiprocessing.shared_memory
+#                 (3.8) and tracemalloc.reset_peak (3.9).
+
+"""
+Tagging service of the NER system.
+
+The model is loaded once and the requests are served over a Unix
+socket or a localhost TCP port. The protocol is one json object per
+line in each direction:
+
+    request:  {"id": 1, "words": ["El", "Papa"], "poss": ["DA", "NC"]}
+    response: {"id": 1, "labels": ["O", "B-PER"]}
+
+The id is optional and returned as it is, so a client can send many
+requests on one connection without waiting for the answers. At most
+max_pending requests of a connection are served at once, the next
+lines are not read before one of them is answered, so a client that
+sends too fast or stops reading cannot grow the memory of the server.
+A line longer than max_line bytes gets an error and the connection
+is closed. The concurrent requests are collected into micro-batches,
+and each batch is scored with one NER.tag_many call.
+
+Example:
+
+    python3 server.py model.bin --socket /tmp/ner.sock
+    python3 server.py model.bin --port 8765 --max-batch 32 --max-wait 2
+    python3 server.py model.bin --socket /tmp/ner.sock --ortho-cache-size 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from ner import NER
+from ner import DECODES
+
+# The number of pending connections of the listening socket.
+BACKLOG = 1024
+# The maximum number of requests served at once for one connection.
+MAX_PENDING = 64
+# The maximum length of a request line in bytes.
+MAX_LINE = 1 << 20
+
+
+def check_tokens(name, tokens):
+    """Check that the tokens of a request are a list of non-empty strings.
+
+    Args:
+        name: str - The field of the request.
+        tokens: The value of the field.
+    """
+    if not isinstance(tokens, list):
+        raise Exception('The {a} are not a list !'.format(a=name))
+    for token in tokens:
+        if not isinstance(token, str) or len(token) == 0:
+            s = 'The {a} have an invalid token {b} !'
+            raise Exception(s.format(a=name, b=json.dumps(token)))
+
+
+class Batcher:
+    """Collect the concurrent requests into micro-batches.
+
+    A batch is scored as soon as it has max_batch sentences,
+    or max_wait seconds after its first sentence arrived.
+    """
+    def __init__(self, ner, max_batch=32, max_wait=0.002, decode='argmax'):
+        """Construct a new batcher.
+
+        Args:
+            ner: NER - A trained NER system.
+            max_batch: int - The maximum number of sentences in one batch.
+            max_wait: float - The maximum seconds a sentence waits
+                              for the other ones of its batch.
+            decode: str - One of ner.DECODES.
+        """
+        self._ner = ner
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._decode = decode
+        self._queue = asyncio.Queue()
+        self._task = None
+
+        # Statistics.
+        self.batches = 0
+        self.sentences = 0
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def tag(self, words, poss):
+        """Tag one sentence.
+
+        Args:
+            words: list(str)
+            poss: list(str)
+
+        Returns:
+            list(str) - The labels.
+        """
+        # A bad request fails alone, before it joins a batch.
+        check_tokens('words', words)
+        check_tokens('poss', poss)
+        if len(words) != len(poss):
+            raise Exception('Words and poss are not matched !')
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put(((words, poss), future))
+        return await future
+
+    ########################################################
+    # Private methods
+    ########################################################
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self._max_wait
+            while len(batch) < self._max_batch:
+                # Take what is already there before waiting.
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+            self._score(batch)
+
+    def _score(self, batch):
+        """Score a batch and resolve the futures of its requests.
+
+        If the batch fails, its sentences are scored one by one,
+        so only the bad ones get the error.
+
+        Args:
+            batch: list(((words, poss), asyncio.Future))
+        """
+        sentences = [item for item, _ in batch]
+        try:
+            predicts = self._ner.tag_many(sentences, self._decode)
+        except Exception:
+            predicts = []
+            for words, poss in sentences:
+                try:
+                    predicts.append(self._ner.tag(words, poss, self._decode))
+                except Exception as e:
+                    predicts.append(e)
+        for (_, future), labels in zip(batch, predicts):
+            if future.done():
+                continue
+            if isinstance(labels, Exception):
+                future.set_exception(labels)
+            else:
+                future.set_result(labels)
+        self.batches += 1
+        self.sentences += len(batch)
+
+
+class Server:
+    """Serve the tagging requests of the clients.
+    """
+    def __init__(self, ner, max_batch=32, max_wait=0.002, decode='argmax',
+                 max_pending=MAX_PENDING, max_line=MAX_LINE):
+        """Construct a new server.
+
+        Args:
+            ner: NER - A trained NER system.
+            max_batch: int - The maximum number of sentences in one batch.
+            max_wait: float - The maximum seconds a sentence waits
+                              for the other ones of its batch.
+            decode: str - One of ner.DECODES.
+            max_pending: int - The maximum number of requests served
+                               at once for one connection.
+            max_line: int - The maximum length of a request line in bytes.
+        """
+        self._batcher = Batcher(ner, max_batch, max_wait, decode)
+        self._max_pending = max_pending
+        self._max_line = max_line
+        self._server = None
+        self._path = None
+
+    async def start(self, path=None, host='127.0.0.1', port=8765):
+        """Start listening on a Unix socket, or a TCP port
+        if path is None.
+
+        Args:
+            path: str - The path of the Unix socket.
+            host: str
+            port: int
+        """
+        self._batcher.start()
+        if path is not None:
+            if os.path.exists(path):
+                os.remove(path)
+            self._server = await asyncio.start_unix_server(
+                    self._handle, path=path, backlog=BACKLOG,
+                    limit=self._max_line)
+            self._path = path
+        else:
+            self._server = await asyncio.start_server(
+                    self._handle, host=host, port=port, backlog=BACKLOG,
+                    limit=self._max_line)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._path is not None and os.path.exists(self._path):
+            os.remove(self._path)
+            self._path = None
+        await self._batcher.close()
+
+    async def serve_forever(self):
+        begin = time.time()
+        try:
+            while True:
+                await asyncio.sleep(60)
+                batcher = self._batcher
+                if batcher.batches > 0:
+                    s = 'Served {a} sentences in {b} batches, '
+                    s += '{c:.1f} sentences/sec.'
+                    print(s.format(a=batcher.sentences, b=batcher.batches,
+                                   c=batcher.sentences/(time.time()-begin)))
+        finally:
+            await self.close()
+
+    ########################################################
+    # Private methods
+    ########################################################
+    async def _handle(self, reader, writer):
+        """Serve one connection, each line is handled concurrently.
+        """
+        tasks = set()
+        pending = asyncio.Semaphore(self._max_pending)
+        # The answers are written one at a time.
+        lock = asyncio.Lock()
+        try:
+            while True:
+                # Stop reading while max_pending requests are served.
+                await pending.acquire()
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # The line is over the limit of the reader.
+                    pending.release()
+                    s = 'The request is longer than {a} bytes !'
+                    reval = {'error': s.format(a=self._max_line)}
+                    await self._write(reval, writer, lock)
+                    break
+                if len(line.strip()) == 0:
+                    pending.release()
+                    if len(line) == 0:
+                        break
+                    continue
+                task = asyncio.ensure_future(self._answer(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: pending.release())
+            if len(tasks) != 0:
+                await asyncio.wait(tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _answer(self, line, writer, lock):
+        reval = dict()
+        try:
+            request = json.loads(line.decode('utf-8'))
+            if 'id' in request:
+                reval['id'] = request['id']
+            reval['labels'] = await self._batcher.tag(request['words'],
+                                                      request['poss'])
+        except KeyError as e:
+            reval['error'] = 'Missing field {a} !'.format(a=e)
+        except Exception as e:
+            reval['error'] = str(e)
+        await self._write(reval, writer, lock)
+
+    async def _write(self, reval, writer, lock):
+        """Write an answer and wait until the client has read enough.
+        """
+        async with lock:
+            if writer.is_closing():
+                return
+            try:
+                writer.write(json.dumps(reval).encode('utf-8') + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                # The client is gone, the other answers fail the same way.
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip(),
+                                     formatter_class=argparse.
+                                     RawDescriptionHelpFormatter)
+    parser.add_argument('model', help='The model file saved by NER.save.')
+    parser.add_argument('--socket', default=None,
+                        help='Listen on this Unix socket.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-wait', type=float, default=2.0,
+                        help='The maximum wait of a batch in milliseconds.')
+    parser.add_argument('--decode', default='argmax', choices=DECODES)
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                        help='The maximum number of requests served at '
+                             'once for one connection.')
+    parser.add_argument('--max-line', type=int, default=MAX_LINE,
+                        help='The maximum length of a request line '
+                             'in bytes.')
+    parser.add_argument('--ortho-cache-size', type=int, default=1 << 16,
+                        help='The maximum number of words whose '
+                             'orthographic features are cached, '
+                             'so the memory does not grow with the input.')
+    args = parser.parse_args()
+
+    ner = NER.load(args.model, ortho_cache_size=args.ortho_cache_size)
+    server = Server(ner, args.max_batch, args.max_wait / 1000, args.decode,
+                    args.max_pending, args.max_line)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(server.start(args.socket, args.host, args.port))
+    where = args.socket or '{a}:{b}'.format(a=args.host, b=args.port)
+    print('Serving on {a}...'.format(a=where))
+    try:
+        loop.run_until_complete(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
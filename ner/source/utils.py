@@ -47,15 +47,45 @@ class IOManager:
                 poss.append(s[1].strip())
                 labels.append(s[2].strip())
 
-    def write_sentences(self, path, sentences):
+    def read_chunks(self, path, chunk_size):
+        """Read the sentences chunk by chunk.
+
+        Args:
+            path: str - The corpus path.
+            chunk_size: int - The number of sentences in one chunk.
+
+        Yields:
+            list((words, poss, labels))
+        """
+        chunk = []
+        for item in self.read_sentences(path):
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) != 0:
+            yield chunk
+
+    def write_sentences(self, path, sentences, buffering=1 << 20):
         """Write the sentences into file.
 
+        The sentences can be a generator, each one is
+        written as soon as it is generated.
+
         Args:
             path:str -  The path of output file.
+            sentences: iterable(Sentence)
+            buffering: int - The size of the output buffer.
+
+        Returns:
+            int - The number of written sentences.
         """
-        with open(path, 'w', encoding='latin-1') as f:
+        count = 0
+        with open(path, 'w', encoding='latin-1', buffering=buffering) as f:
             for sent in sentences:
                 f.write(str(sent))
+                count += 1
+        return count
 
 if __name__ == '__main__':
     path = '../data/esp.train'
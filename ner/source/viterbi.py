@@ -13,10 +13,197 @@
 Implement the Viterbi algorithm.
 """
 
+import array
+import time
+
 import numpy as np
 
-START = '#S'
-END = '#E'
+
+def _pruned(beam, label_size):
+    """Check the beam width.
+
+    Returns:
+        bool - Whether the search is pruned.
+    """
+    if beam is not None and beam < 1:
+        raise Exception('The beam width must be positive !')
+    return beam is not None and beam < label_size
+
+
+def _step(score, trans, beam):
+    """One step of the viterbi recursion for a batch of sequences.
+
+    Args:
+        score: numpy.ndarray - (batch x label_size) scores of the
+                               previous position.
+        trans: numpy.ndarray - (label_size x label_size) transition scores.
+        beam: int - Only extend the best beam labels, None means all.
+
+    Returns:
+        new: numpy.ndarray - (batch x label_size) best scores of
+                             each label, without the emission.
+        best: numpy.ndarray - (batch x label_size) the previous label
+                              of each best score.
+    """
+    if beam is not None:
+        rows = np.arange(len(score))[:, None]
+        # The top beam labels of each sequence, in no order.
+        top = np.argpartition(-score, beam-1, axis=1)[:, :beam]
+        # cand[b, k, t]: come from the k-th top label to label t.
+        cand = score[rows, top][:, :, None] + trans[top]
+        best = cand.argmax(axis=1)
+        return cand.max(axis=1), top[rows, best]
+    # cand[b, j, t]: come from label j to label t.
+    cand = score[:, :, None] + trans
+    return cand.max(axis=1), cand.argmax(axis=1)
+
+
+def decode_batch(emit, lengths, trans, start, end, beam=None):
+    """Run the viterbi recursion over a padded batch.
+
+    Args:
+        emit: numpy.ndarray - (batch x max_len x label_size) emission scores,
+                              the padded positions are ignored.
+        lengths: numpy.ndarray - The real length of each sequence.
+        trans: numpy.ndarray - (label_size x label_size) transition scores.
+        start: numpy.ndarray - The START transition scores.
+        end: numpy.ndarray - The END transition scores.
+        beam: int - Only extend the best beam labels of each step,
+                    None or a beam not smaller than label_size
+                    means the exact search.
+
+    Returns:
+        list(list(int)) - The label ids of each sequence.
+    """
+    B, T, L = emit.shape
+    if not _pruned(beam, L):
+        beam = None
+    back = np.zeros((B, T, L), dtype=np.intp)
+    # Backpointers of the padded positions keep the label unchanged.
+    keep = np.broadcast_to(np.arange(L), (B, L))
+    score = start + emit[:, 0]
+    for index in range(1, T):
+        active = (index < lengths)[:, None]
+        new, best = _step(score, trans, beam)
+        score = np.where(active, new + emit[:, index], score)
+        back[:, index] = np.where(active, best, keep)
+    score = score + end
+
+    # Recover the sequence labels of the whole batch at once.
+    seqs = np.zeros((B, T), dtype=np.intp)
+    seqs[:, T-1] = score.argmax(axis=1)
+    rows = np.arange(B)
+    for index in range(T-1, 0, -1):
+        seqs[:, index-1] = back[rows, index, seqs[:, index]]
+    return [seq[:n].tolist() for seq, n in zip(seqs, lengths)]
+
+
+def count_transitions(label_seqs, label_size):
+    """Count the label bigrams of the sequences.
+
+    Args:
+        label_seqs: iterable(list(int)) - The label ids of each sequence.
+        label_size: int - The number of labels.
+
+    Returns:
+        numpy.ndarray - (label_size+1 x label_size+1) counts, the extra
+                        row is START and the extra column is END.
+    """
+    L = label_size
+    # Label ids, START is L and END is L as well:
+    # START only appears as a previous label, END only as a next one.
+    prev_ids = array.array('q')
+    next_ids = array.array('q')
+    for labels in label_seqs:
+        if len(labels) == 0:
+            continue
+        prev_ids.append(L)
+        prev_ids.extend(labels)
+        next_ids.extend(labels)
+        next_ids.append(L)
+    prev_ids = np.frombuffer(prev_ids, dtype=np.int64)
+    next_ids = np.frombuffer(next_ids, dtype=np.int64)
+    counts = np.bincount(prev_ids * (L+1) + next_ids, minlength=(L+1)*(L+1))
+    return counts.reshape(L+1, L+1)
+
+
+def log_transitions(counts):
+    """Turn the transition counts into log-probabilities
+    with add-one smoothing.
+
+    Args:
+        counts: numpy.ndarray - The same as count_transitions.
+
+    Returns:
+        trans: numpy.ndarray - (label_size x label_size) scores.
+        start: numpy.ndarray - The START transition scores.
+        end: numpy.ndarray - The END transition scores.
+    """
+    L = counts.shape[0] - 1
+    trans = np.log((counts + 1) / (counts.sum(axis=1, keepdims=True) + L))
+    return (np.ascontiguousarray(trans[:L, :L]), trans[L, :L].copy(),
+            trans[:L, L].copy())
+
+
+def bio_constraint(tags):
+    """Build the transition scores of the hard BIO constraint:
+    I-X can only follow B-X or I-X.
+
+    Args:
+        tags: list(str) - The tag of each label id.
+
+    Returns:
+        trans: numpy.ndarray - 0 for the allowed transitions,
+                               -inf for the others.
+        start: numpy.ndarray - The START transition scores.
+        end: numpy.ndarray - The END transition scores.
+    """
+    L = len(tags)
+    trans = np.zeros((L, L), dtype=np.float64)
+    start = np.zeros(L, dtype=np.float64)
+    for t, tag in enumerate(tags):
+        if not tag.startswith('I-'):
+            continue
+        start[t] = -np.inf
+        for j, prev in enumerate(tags):
+            if prev[2:] != tag[2:] or prev == 'O':
+                trans[j, t] = -np.inf
+    return trans, start, np.zeros(L, dtype=np.float64)
+
+
+def decode_concat(emit, lengths, trans, start, end, beam=None):
+    """Run the viterbi recursion over the concatenated
+    emission scores of many sequences in one batch.
+
+    Args:
+        emit: numpy.ndarray - (tokens x label_size) emission scores,
+                              the sequences one after another.
+        lengths: numpy.ndarray - The length of each sequence.
+        trans: numpy.ndarray - (label_size x label_size) transition scores.
+        start: numpy.ndarray - The START transition scores.
+        end: numpy.ndarray - The END transition scores.
+        beam: int - The beam width of decode_batch.
+
+    Returns:
+        list(list(int)) - The label ids of each sequence.
+    """
+    lengths = np.asarray(lengths, dtype=np.intp)
+    reval = [[] for _ in lengths]
+    rows = np.flatnonzero(lengths > 0)
+    if len(rows) == 0:
+        return reval
+    L = emit.shape[1]
+    T = lengths.max()
+    # Scatter the tokens into a padded (batch x max_len x labels) array.
+    sub = lengths[rows]
+    offsets = np.repeat(np.cumsum(sub) - sub, sub)
+    steps = np.arange(len(offsets)) - offsets
+    padded = np.zeros((len(rows), T, L), dtype=emit.dtype)
+    padded[np.repeat(np.arange(len(rows)), sub), steps] = emit
+    seqs = decode_batch(padded, sub, trans, start, end, beam)
+    for row, seq in zip(rows, seqs):
+        reval[row] = seq
+    return reval
 
 
 class Viterbi:
@@ -26,106 +213,223 @@ class Viterbi:
         """Construct a new Viterbi class.
 
         Args:
-            sentences: list(sentence)
+            label_size: int - The number of labels.
         """
-        self._trans = dict()
-        self._emit = dict()
         self._label_size = label_size
 
+        # Counts, the extra row is START and the extra column is END.
+        self._trans = np.zeros((label_size+1, label_size+1), dtype=np.int64)
+        # (label_size x observation) counts.
+        self._emit = np.zeros((label_size, 0), dtype=np.int64)
+        self._obs_ids = dict()
+
+        # Compiled log-probability tables.
+        self._log_trans = None
+        self._log_start = None
+        self._log_end = None
+        self._log_emit = None
+
+        # Sentences/sec of the last search_batch call.
+        self.throughput = 0.0
+
+    @property
+    def label_size(self):
+        return self._label_size
+
+    @property
+    def observations(self):
+        return list(self._obs_ids)
+
     def train(self, sentences):
         """Extracting the probability distribution
             from sentences.
+
+        The labels and word|pos observations are encoded into integer
+        ids once, and the counts are accumulated with np.bincount.
+        Calling train again adds the new counts to the old ones.
+
         Args:
             sentences: list(Sentence)
         """
+        # The compiled tables are out of date now.
+        self._log_emit = None
+        L = self._label_size
+        obs_ids = self._obs_ids
+
+        label_seqs = []
+        emit_labels = array.array('q')
+        emit_obs = array.array('q')
         for sent in sentences:
-            # For transition probabilities
             labels = sent.labels
-            labels.insert(0, START)
-            labels.append(END)
-            for index in range(1, len(labels)):
-                key = labels[index-1]
-                value = labels[index]
-                if key not in self._trans:
-                    self._trans[key] = dict()
-                self._trans[key][value] = self._trans[key].get(value, 0) + 1
-
-            # For emit probabilities.
-            labels = sent.labels
-            poss = sent.poss
-            words = sent.words
-            for label, pos, word in zip(labels, poss, words):
-                key = label
-                value = '|'.join([word, pos])
-                if key not in self._emit:
-                    self._emit[key] = dict()
-                self._emit[key][value] = self._emit[key].get(value, 0) + 1
-
-    def search(self, sentence):
+            label_seqs.append(labels)
+            emit_labels.extend(labels)
+            for word, pos in zip(sent.words, sent.poss):
+                key = '|'.join([word, pos])
+                index = obs_ids.get(key)
+                if index is None:
+                    index = len(obs_ids)
+                    obs_ids[key] = index
+                emit_obs.append(index)
+        self._trans += count_transitions(label_seqs, L)
+
+        V = len(obs_ids)
+        emit_labels = np.frombuffer(emit_labels, dtype=np.int64)
+        emit_obs = np.frombuffer(emit_obs, dtype=np.int64)
+        emit = np.bincount(emit_labels * V + emit_obs, minlength=L*V)
+        old = self._emit
+        self._emit = emit.reshape(L, V)
+        self._emit[:, :old.shape[1]] += old
+
+    def compile(self):
+        """Freeze the counts into log-probability tables.
+
+        The transition table is a (label_size x label_size) matrix,
+        plus the START and END vectors. The emission table is indexed
+        by the integer code of the word|pos observation, the last
+        column is reserved for unseen observations.
+        """
+        L = self._label_size
+
+        # Transition probabilities with add-one smoothing.
+        self._log_trans, self._log_start, self._log_end = log_transitions(
+                self._trans)
+
+        # Emission probabilities with add-one smoothing,
+        # the extra column is the unseen observation.
+        V = self._emit.shape[1]
+        emit = np.zeros((L, V+1), dtype=np.float64)
+        emit[:, :V] = self._emit
+        denominator = emit.sum(axis=1, keepdims=True) + V + 1
+        # Stored as (observation x label) so one row is one time step.
+        self._log_emit = np.ascontiguousarray(
+                np.log((emit + 1) / denominator).T)
+
+    def tables(self):
+        """Return the compiled tables.
+
+        Returns:
+            dict(str, numpy.ndarray)
+        """
+        if self._log_emit is None:
+            self.compile()
+        return {
+                'trans': self._log_trans,
+                'start': self._log_start,
+                'end': self._log_end,
+                'emit': self._log_emit,
+                }
+
+    def load_tables(self, tables, observations):
+        """Use the given compiled tables instead of training.
+
+        Args:
+            tables: dict(str, numpy.ndarray) - The same as tables().
+            observations: list(str) - The word|pos observations in id order.
+        """
+        self._obs_ids = dict()
+        for obs in observations:
+            self._obs_ids[obs] = len(self._obs_ids)
+        self._log_trans = tables['trans']
+        self._log_start = tables['start']
+        self._log_end = tables['end']
+        self._log_emit = tables['emit']
+
+    def search(self, sentence, beam=None):
         """Run the viterbi algorihtm
             to search for the best sequence.
+
+        Args:
+            sentence: Sentence
+            beam: int - Only extend the best beam labels of each step,
+                        None means the exact search.
+
+        Returns:
+            list(int) - The label ids.
         """
+        if self._log_emit is None:
+            self.compile()
         n = len(sentence)
-        words = sentence.words
-        poss = sentence.poss
-
-        # Initialize the table
-        # table size: label_size * n
-        table = []
-        back = []
-        for _ in range(self._label_size):
-            table.append([None]*n)
-            back.append([None]*n)
-
-        for t in range(self._label_size):
-            word = '|'.join([words[0], poss[0]])
-            table[t][0] = self._get_trans(START, t) * self._get_emit(t, word)
-            back[t][0] = 0
-
-        for index in range(1, len(words)):
-            word = '|'.join([words[index], poss[index]])
-            for t in range(self._label_size):
-                m = float('-INF')
-                maxj = -1
-                for j in range(self._label_size):
-                    prob = table[j][index-1] * self._get_trans(j, t)
-                    if prob > m:
-                        prob = m
-                        maxj = j
-                table[t][index] = self._get_emit(t, word) * m
-                back[t][index] = maxj
+        if n == 0:
+            return []
+        obs = self._encode(sentence)
+        emit = self._log_emit[obs]
+        trans = self._log_trans
+        if not _pruned(beam, self._label_size):
+            beam = None
 
-        # Recover the sequence label
-        seq = [None] * n
-        score = [table[j][n-1] for j in range(len(self._label_size))]
-        seq[n-1] = np.argmax(score)
+        # A batch of one sequence, which needs no padding.
+        back = np.zeros((n, self._label_size), dtype=np.intp)
+        score = (self._log_start + emit[0])[None]
+        for index in range(1, n):
+            score, best = _step(score, trans, beam)
+            score += emit[index]
+            back[index] = best[0]
+        score = score[0] + self._log_end
 
-        for i in range(n-2, -1, -1):
-            seq[i] = back[seq[i+1]][i+1]
+        # Recover the sequence label
+        seq = [0] * n
+        seq[n-1] = int(score.argmax())
+        for i in range(n-1, 0, -1):
+            seq[i-1] = int(back[i, seq[i]])
         return seq
 
-    def _get_emit(self, label, word):
-        """Generate the emit probability.
+    def search_batch(self, sentences, batch_size=256, beam=None):
+        """Run the viterbi algorithm over many sentences.
+
+        The sentences are sorted by length and grouped into buckets
+        of batch_size, so that each bucket needs little padding.
 
         Args:
-            label: int - The label.
-            word: str - The word and pos tag.
+            sentences: list(Sentence)
+            batch_size: int - The number of sentences in one bucket.
+            beam: int - Only extend the best beam labels of each step,
+                        None means the exact search.
+
+        Returns:
+            list(list(int)) - The label ids, in the input order.
         """
-        denominator = 0
-        for key in self._emit[label]:
-            denominator += self._emit[label][key]
+        if self._log_emit is None:
+            self.compile()
+        begin = time.time()
+        L = self._label_size
+        lengths = np.array([len(sent) for sent in sentences], dtype=np.intp)
+        order = np.argsort(lengths, kind='stable')
+        reval = [[] for _ in sentences]
 
-        return self._emit[label][word] / denominator
+        for i in range(0, len(order), batch_size):
+            bucket = order[i:i+batch_size]
+            bucket = bucket[lengths[bucket] > 0]
+            if len(bucket) == 0:
+                continue
+            T = lengths[bucket].max()
+            # Pad with the unseen observation.
+            obs = np.full((len(bucket), T), len(self._obs_ids),
+                          dtype=np.intp)
+            for row, index in enumerate(bucket):
+                obs[row, :lengths[index]] = self._encode(sentences[index])
+            emit = self._log_emit[obs].reshape(len(bucket), T, L)
+            seqs = decode_batch(emit, lengths[bucket], self._log_trans,
+                                self._log_start, self._log_end, beam)
+            for index, seq in zip(bucket, seqs):
+                reval[index] = seq
 
-    def _get_trans(self, pre_label, post_label):
-        """Generate the trnas probability.
+        elapsed = time.time() - begin
+        self.throughput = len(sentences) / elapsed if elapsed > 0 else 0.0
+        return reval
+
+    def _encode(self, sentence):
+        """Map the word|pos observations into integer codes.
 
         Args:
-            pre_label: {int, str} - The last label.
-            post_label: int - The currnt label.
+            sentence: Sentence
+
+        Returns:
+            numpy.ndarray - The observation codes, the unseen
+                            observations are mapped to the last code.
         """
-        denominator = 0
-        for key in self._trans[pre_label]:
-            denominator += self._trans[pre_label][key]
-        A = self._trans[pre_label].get(post_label, 0) + 1
-        return A / (denominator+self._label_size)
+        unk = len(self._obs_ids)
+        obs_ids = self._obs_ids
+        keys = ['|'.join([word, pos])
+                for word, pos in zip(sentence.words, sentence.poss)]
+        return np.array([obs_ids.get(key, unk) for key in keys],
+                        dtype=np.intp)